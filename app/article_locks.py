@@ -0,0 +1,30 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+# per-article locks, so two operations never rewrite the page of
+# the same article at the same time. each entry is [lock, number of users]
+article_locks: dict[str, list] = {}
+
+
+@asynccontextmanager
+async def article_lock(slug: str):
+    """
+    Hold the lock of the given article slug, and remove
+    it once no one is waiting for it anymore.
+
+    Never wait for the lock of an article while holding the lock
+    of another one: two tasks doing so in the opposite order
+    would wait for each other forever.
+    """
+
+    entry = article_locks.setdefault(slug, [asyncio.Lock(), 0])
+    entry[1] += 1
+
+    try:
+        async with entry[0]:
+            yield
+
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del article_locks[slug]
@@ -0,0 +1,91 @@
+import asyncio
+import copy
+
+from app.build_article import make_article
+from app.fetch import fetch_articles
+
+
+def make_store() -> dict[str, asyncio.Task]:
+    """
+    Make a new, build-scoped, article store.
+
+    The store maps an article title to the task running `make_article`
+    for it: every function taking part in the same build shares it,
+    so each article is fetched and parsed only once per build.
+    """
+
+    return {}
+
+
+async def get_article(
+    page_title: str,
+    client,
+    store: dict[str, asyncio.Task] | None = None,
+    revid: int | None = None,
+) -> dict[str, list[str] | list[dict[str, str]]] | None:
+    """
+    Return the article for the given page_title, by either reusing
+    the one in the store or by running `make_article` for it.
+
+    If revid is set and the stored article has a different revision,
+    we build the article again.
+
+    The article is returned as a copy, since the calling functions
+    tend to update its fields (eg the frontpage setting its own slug).
+    """
+
+    if store is None:
+        return await make_article(page_title, client)
+
+    task = store.get(page_title)
+
+    if task is not None and revid is not None and task.done():
+        article = task.result()
+        if article is not None and article["metadata"]["revid"] != revid:
+            task = None
+
+    if task is None:
+        task = asyncio.ensure_future(make_article(page_title, client))
+        store[page_title] = task
+
+    article = await task
+
+    return copy.deepcopy(article)
+
+
+def add_article(
+    store: dict[str, asyncio.Task],
+    article: dict[str, list[str] | list[dict[str, str]]],
+) -> None:
+    """
+    Add to the store an article already built outside of it,
+    eg by the UDP server, so the following steps reuse it.
+    """
+
+    task = asyncio.get_running_loop().create_future()
+    task.set_result(article)
+    store[article["title"]] = task
+
+
+def prefetch_articles(
+    titles: list[str], client, store: dict[str, asyncio.Task]
+) -> None:
+    """
+    Add to the store the articles for the given titles that are not in it
+    yet, fetching them together with `fetch_articles` so their metadata is
+    queried in batches, instead of one article at a time.
+    """
+
+    titles = [title for title in dict.fromkeys(titles) if title not in store]
+
+    if len(titles) == 0:
+        return
+
+    batch = asyncio.ensure_future(fetch_articles(titles, client))
+
+    async def build(page_title: str):
+        fetched = await batch
+        return await make_article(page_title, client, fetched[page_title])
+
+    for title in titles:
+        store[title] = asyncio.ensure_future(build(title))
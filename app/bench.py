@@ -0,0 +1,402 @@
+import asyncio
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlencode
+
+import httpx
+import typer
+from typing_extensions import Annotated
+
+# the benchmarks run against a copy of the project in a temporary folder
+# (see `setup_work_dir`): every app module reads its settings when
+# imported, so we import them only once the work folder is ready
+
+PROJECT_DIR = Path.cwd()
+BENCH_DIR = PROJECT_DIR / "bench"
+CORPUS_PATH = BENCH_DIR / "corpus.json"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+
+# kind of article => how to pick it among the recorded ones,
+# given the HTML text of the article
+SAMPLES = {
+    "small": lambda text: -len(text),
+    "large": lambda text: len(text),
+    "link-heavy": lambda text: text.count("<a "),
+    "image-heavy": lambda text: text.count("<img "),
+}
+
+bench = typer.Typer()
+
+
+def make_request_key(request: httpx.Request) -> str:
+    """
+    Return the key of the given request in the corpus: its path
+    and sorted query parameters, without the ones changing between
+    runs (eg `maxlag`).
+    """
+
+    params = sorted(
+        (k, v) for k, v in request.url.params.multi_items() if k != "maxlag"
+    )
+
+    return f"{request.url.path}?{urlencode(params)}"
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Send requests to MediaWiki and record every response in the corpus.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, corpus: dict[str, Any]):
+        self.transport = transport
+        self.corpus = corpus
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.transport.handle_async_request(request)
+        body = await response.aread()
+
+        self.corpus["responses"][make_request_key(request)] = {
+            "status": response.status_code,
+            "body": body.decode(),
+        }
+
+        return httpx.Response(
+            response.status_code, headers=response.headers, content=body
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def make_replay_transport(
+    corpus: dict[str, Any], misses: list[str]
+) -> httpx.MockTransport:
+    """
+    Return a transport answering every request with its recorded
+    response, or with a 404 if it is not in the corpus (the request
+    is then added to misses).
+    """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        key = make_request_key(request)
+        recorded = corpus["responses"].get(key)
+
+        if recorded is None:
+            misses.append(key)
+            return httpx.Response(404, json={})
+
+        return httpx.Response(
+            recorded["status"],
+            content=recorded["body"].encode(),
+            headers={"content-type": "application/json"},
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def setup_work_dir() -> Path:
+    """
+    Make a temporary copy of the project settings, point WIKI_DIR,
+    DATA_DIR, etc. to it and move into it, so a benchmark never
+    touches the website or the build database.
+    """
+
+    work_dir = Path(tempfile.mkdtemp(prefix="hd-bench-"))
+
+    shutil.copy(PROJECT_DIR / "settings.toml", work_dir / "settings.toml")
+
+    assets_dir = os.getenv("ASSETS_DIR", "assets")
+    (work_dir / "assets").symlink_to((PROJECT_DIR / assets_dir).resolve())
+
+    os.environ.update(
+        {
+            "WIKI_DIR": "wiki",
+            "MEDIA_DIR": "wiki/assets/media",
+            "ASSETS_DIR": "assets",
+            "DATA_DIR": "data",
+            "LOG_DIR": "logs",
+        }
+    )
+    os.environ.setdefault("SEMAPHORE", "100")
+    os.environ.setdefault("BASE_URL", "http://localhost/api.php")
+
+    for folder in ["wiki/assets/media", "data", "logs"]:
+        (work_dir / folder).mkdir(parents=True, exist_ok=True)
+
+    os.chdir(work_dir)
+
+    return work_dir
+
+
+def pick_samples(corpus: dict[str, Any]) -> dict[str, str]:
+    """
+    Pick the title of one recorded article for each kind in SAMPLES.
+    """
+
+    texts = {}
+    for recorded in corpus["responses"].values():
+        data = json.loads(recorded["body"] or "{}")
+        if "parse" in data:
+            texts[data["parse"]["title"]] = data["parse"]["text"]
+
+    if len(texts) == 0:
+        return {}
+
+    return {
+        kind: max(sorted(texts), key=lambda title: measure(texts[title]))
+        for kind, measure in SAMPLES.items()
+    }
+
+
+def get_peak_rss() -> float:
+    """
+    Return the peak resident set size of the process so far, in MB.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # bytes on macOS, kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+
+    return peak / 1024
+
+
+async def time_stage(
+    func: Callable[[], Awaitable[Any] | Any], runs: int
+) -> dict[str, float]:
+    """
+    Run func the given number of times and return its latency
+    stats, throughput and the peak RSS of the process after it.
+    """
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        if asyncio.iscoroutine(result):
+            await result
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+
+    return {
+        "runs": runs,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "per_second": runs / sum(timings) if sum(timings) > 0 else 0.0,
+        "rss_mb": get_peak_rss(),
+    }
+
+
+async def run_stages(corpus: dict[str, Any], runs: int) -> dict[str, dict[str, float]]:
+    """
+    Run every benchmark stage and return their results, by stage name.
+
+    The same requests are sent when recording and when replaying the
+    corpus: a full build first, then every sample article on its own.
+    When recording, samples are picked among the articles of the build.
+    """
+
+    from app.build_article import make_article
+    from app.build_manifest import get_manifest
+    from app.build_wiki import main as build_wiki
+    from app.category_store import get_category_items
+    from app.fetch import close_client, fetch_article, get_client
+    from app.parser import parser
+    from app.read_settings import main as read_settings
+    from app.views.template_utils import get_template
+    from app.views.views import make_event_index
+
+    results = {}
+
+    # -- full build, once: it fills the build database used below
+    start = time.perf_counter()
+    await build_wiki(os.getenv("ENV"), os.getenv("BASE_URL"))
+    seconds = time.perf_counter() - start
+
+    articles = len(get_manifest())
+    results["build"] = {
+        "runs": 1,
+        "mean_ms": seconds * 1000,
+        "p50_ms": seconds * 1000,
+        "p95_ms": seconds * 1000,
+        "per_second": articles / seconds,
+        "rss_mb": get_peak_rss(),
+    }
+
+    if len(corpus["samples"]) == 0:
+        corpus["samples"] = pick_samples(corpus)
+
+    client = get_client()
+
+    for kind, title in corpus["samples"].items():
+        fetched = await fetch_article(title, client)
+        article, backlinks, redirect_target = fetched
+
+        if article is None:
+            print(f"bench => {kind} article {title} not found, skipping it")
+            continue
+
+        results[f"fetch:{kind}"] = await time_stage(
+            lambda: fetch_article(title, client), runs
+        )
+        results[f"parse:{kind}"] = await time_stage(
+            lambda: parser(article, redirect_target), runs
+        )
+
+        page = await make_article(title, client, fetched)
+        cats = page["metadata"]["categories"]
+        template = get_template(cats[0] if len(cats) > 0 else "article")
+
+        results[f"render:{kind}"] = await time_stage(
+            lambda: template.render(article=page), runs
+        )
+
+    await close_client()
+
+    config = read_settings()
+    event_label = config["wiki"]["categories"]["Event"]["label"]
+    events = get_category_items("Event")
+
+    results["event-index"] = await time_stage(
+        lambda: make_event_index(events, "Event", event_label), runs
+    )
+
+    return results
+
+
+def print_results(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]] | None,
+) -> None:
+    """
+    Print the results of every stage, compared to the baseline if any.
+    """
+
+    def change(stage: str, field: str) -> str:
+        if baseline is None or stage not in baseline:
+            return ""
+
+        before = baseline[stage][field]
+        if before == 0:
+            return ""
+
+        return f"({(results[stage][field] - before) / before * 100:+.1f}%)"
+
+    print(
+        f"{'stage':<20} {'runs':>5} {'mean ms':>10} {'':>9} {'p50 ms':>10}"
+        f" {'p95 ms':>10} {'ops/s':>10} {'peak RSS MB':>12} {'':>9}"
+    )
+
+    for stage, result in results.items():
+        print(
+            f"{stage:<20} {result['runs']:>5} {result['mean_ms']:>10.2f}"
+            f" {change(stage, 'mean_ms'):>9} {result['p50_ms']:>10.2f}"
+            f" {result['p95_ms']:>10.2f} {result['per_second']:>10.1f}"
+            f" {result['rss_mb']:>12.1f} {change(stage, 'rss_mb'):>9}"
+        )
+
+    print("ops/s of the build stage is in articles per second")
+
+
+@bench.command()
+def record(
+    corpus_path: Annotated[Path, typer.Option(help="corpus file")] = CORPUS_PATH,
+):
+    """
+    Run every benchmark stage once against the MediaWiki instance
+    set in BASE_URL, and record every API response into the corpus.
+    """
+
+    corpus_path = corpus_path.resolve()
+    corpus = {"responses": {}, "samples": {}}
+
+    work_dir = setup_work_dir()
+
+    from app import fetch
+
+    transport = httpx.AsyncHTTPTransport(verify=fetch.create_context(fetch.ENV))
+    fetch.http_transport = RecordingTransport(transport, corpus)
+
+    try:
+        asyncio.run(run_stages(corpus, runs=1))
+
+    finally:
+        os.chdir(PROJECT_DIR)
+        shutil.rmtree(work_dir)
+
+    corpus_path.parent.mkdir(parents=True, exist_ok=True)
+    corpus_path.write_text(json.dumps(corpus))
+
+    print(f"bench => recorded {len(corpus['responses'])} responses to {corpus_path}")
+    print(f"bench => samples {corpus['samples']}")
+
+
+@bench.command()
+def run(
+    corpus_path: Annotated[Path, typer.Option(help="corpus file")] = CORPUS_PATH,
+    baseline_path: Annotated[Path, typer.Option(help="baseline file")] = BASELINE_PATH,
+    runs: Annotated[int, typer.Option(help="runs of each stage")] = 20,
+    save_baseline: Annotated[
+        bool, typer.Option(help="save the results as the new baseline")
+    ] = False,
+):
+    """
+    Replay the recorded corpus through every benchmark stage, offline,
+    and compare the results against the baseline, if any.
+    """
+
+    corpus_path = corpus_path.resolve()
+    baseline_path = baseline_path.resolve()
+
+    corpus = json.loads(corpus_path.read_text())
+    misses = []
+
+    # don't let the rate limiter set the pace of an offline run
+    os.environ.setdefault("API_RATE", "100000")
+
+    work_dir = setup_work_dir()
+
+    from app import fetch
+
+    fetch.http_transport = make_replay_transport(corpus, misses)
+
+    try:
+        results = asyncio.run(run_stages(corpus, runs))
+
+    finally:
+        os.chdir(PROJECT_DIR)
+        shutil.rmtree(work_dir)
+
+    if len(misses) > 0:
+        print(
+            f"bench => {len(misses)} requests not found in the corpus,"
+            " record it again:"
+        )
+        for key in dict.fromkeys(misses):
+            print(f"  {key}")
+
+    baseline = None
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+
+    print_results(results, baseline)
+
+    if save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=2))
+        print(f"bench => saved baseline to {baseline_path}")
+
+
+if __name__ == "__main__":
+    bench()
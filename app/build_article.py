@@ -1,23 +1,44 @@
 import asyncio
 import os
 from pathlib import Path
-from typing import Type
+from typing import Collection, Type
 
 import aiofiles
-import httpx
 import jinja2
 from aiofiles import os as aos
 from bs4 import BeautifulSoup, Tag
 from slugify import slugify
 from unidecode import unidecode
 
-from app.fetch import create_context, fetch_article
-from app.file_ops import file_lookup, search_file_content, write_to_disk
-from app.parser import parser
+from app.article_locks import article_lock
+from app.build_manifest import remove_from_manifest, update_manifest
+from app.fetch import fetch_article, get_client
+from app.file_ops import (
+    file_lookup,
+    get_file_index,
+    remove_compressed,
+    remove_from_file_index,
+    write_to_disk,
+)
+from app.link_graph import get_linked_pages, remove_links, update_links
+from app.process_pool import parse_article, render_template, run_in_pool
 from app.read_settings import main as read_settings
-from app.views.template_utils import get_template, make_mw_url_slug, make_timestamp_full
+from app.redirect_map import add_legacy_redirect, add_moved_redirect, remove_redirects
+from app.search_index import remove_from_search_index, update_search_index
+from app.views.template_utils import (
+    get_template,
+    make_event_timestamps,
+    make_mw_url_slug,
+    make_timestamp_full,
+    make_timestamps,
+)
 
 WIKI_DIR = Path(os.getenv("WIKI_DIR"))
+
+# max number of linked articles rebuilt at the same time
+# by `update_backlinks`
+BACKLINKS_MAX_IN_FLIGHT = int(os.getenv("BACKLINKS_MAX_IN_FLIGHT", "4"))
+
 config = read_settings()
 mw_host = config["domain"]["mw_url"]
 
@@ -80,13 +101,22 @@ def get_article_field(field: str, article: dict[str, str]) -> str | None:
 
 
 async def make_article(
-    page_title: str, client
+    page_title: str,
+    client,
+    fetched: tuple | None = None,
+    raise_errors: bool = False,
 ) -> dict[str, list[str] | list[dict[str, str]]] | None:
     """
     Fetch and return a dictionary based on the given page_title.
+    Pass fetched to reuse the data already returned by `fetch_articles`.
+    Pass raise_errors to raise the HTTP errors of the fetch, instead
+    of returning None as for an article not found.
     """
 
-    article, backlinks, redirect_target = await fetch_article(page_title, client)
+    if fetched is None:
+        fetched = await fetch_article(page_title, client, raise_errors)
+
+    article, backlinks, redirect_target = fetched
 
     # TODO: here you need to check if the page is a translation, if so, you fetch the
     # translated display title from mediawiki and pass it to the data as a "display_title"
@@ -101,10 +131,13 @@ async def make_article(
 
     if article is not None:
 
-        body_html, art_metadata, images = parser(article, redirect_target)
+        body_html, art_metadata, images = await run_in_pool(
+            parse_article, article, redirect_target, get_file_index()
+        )
 
         metadata = {
             "id": article["pageid"],
+            "revid": article.get("revid"),
             "title": article["title"],
             "displaytitle": article["displaytitle"],
             "mw_url": mw_url,
@@ -115,14 +148,19 @@ async def make_article(
             "template": get_article_field("templates", article),
             "creation": make_timestamp_full(article["creation"]),
             "last_modified": make_timestamp_full(article["last_modified"]),
+            "timestamps": make_timestamps(article),
             "backlinks": backlinks,
             "nav": nav,
             "footer_nav": footer_nav,
             "parsed_metadata": art_metadata["info"],
             "categories": art_metadata["categories"],
             "tool_repos": art_metadata["repos_index"],
+            "links": art_metadata["links"],
+            "text": art_metadata["text"],
         }
 
+        metadata["timestamps"]["event"] = make_event_timestamps(metadata)
+
         # convert possible unicode title with special characters
         # to "normal" ASCII characters
         # eg 𝒟𝒾𝑔𝒾𝓉𝒶𝓁 𝒲𝑒𝓇𝑒𝒸𝓇𝑒𝒶𝓉𝓊𝓇𝑒𝓈 => Digital Werecreatures
@@ -179,8 +217,9 @@ async def make_redirect_article(
 
                 output = soup.prettify(formatter=None)
 
-            async with aiofiles.open(fn, mode="w") as f:
-                await f.write(output)
+            await write_to_disk(filename, output)
+
+            add_moved_redirect(filename, target_redirect["slug"])
 
         else:
             print(f"redirect-article: {article_title} not found, nothing done")
@@ -200,8 +239,20 @@ async def save_article(
         is_styles_page = "is_styles_page" in article
         if is_styles_page:
             template = get_template( 'styles' )
-        document = template.render(article=article)
+        document = await run_in_pool(render_template, template.name, article)
         await write_to_disk(filepath, document, sem, is_styles_page)
+        update_manifest(article, document)
+
+        if "links" in article["metadata"]:
+            update_links(filepath, article["metadata"]["links"])
+
+        # the frontpage is saved as `index` too, besides its own article
+        if not is_styles_page and filepath != "index":
+            update_search_index(article)
+
+            # a new article might take the slug of a moved one
+            remove_redirects(article["title"], filepath)
+            add_legacy_redirect(article["title"], filepath)
 
 
 async def delete_article(article_title: str) -> None:
@@ -214,6 +265,10 @@ async def delete_article(article_title: str) -> None:
     and just assume we receive the title of the article
     and potentially its cat; if cat is None we scan the
     WIKI_DIR for a matching filename.
+
+    Run `remove_article_traces` before: it looks up the pages
+    to update in the link graph, from which the article's
+    outgoing links are removed here.
     """
 
     print(f"delete-article => {article_title}")
@@ -231,27 +286,56 @@ async def delete_article(article_title: str) -> None:
 
     if await aos.path.exists(fn):
         await aos.remove(fn)
+        remove_compressed(fn)
+        remove_from_file_index(filename)
+        remove_from_manifest(article_title)
+        remove_links(filename)
+        remove_from_search_index(filename)
+        remove_redirects(article_title, filename)
         print(f"delete-article: {article_title} removed")
 
     else:
         print(f"delete-article: {article_title} not found, nothing done")
 
 
-async def remove_article_traces(article_title: str) -> None:
+def get_href_slug(href: str) -> str:
     """
-    Scan WIKI_DIR to find any bits of the given article_title
-    and remove any block + link pointing to it.
+    Return the article slug the given local href points to,
+    eg `/foo-event.html#info` => `foo-event`.
     """
 
-    sem = asyncio.Semaphore(int(os.getenv("SEMAPHORE")))
+    return href.split("#")[0].lstrip("/").removesuffix(".html")
 
-    tasks_html = []
 
-    cats = config["wiki"]["categories"]
-    cat_labels = []
+async def remove_article_traces(
+    article_title: str,
+    keep: Collection[str] = (),
+    linked: Collection[str] | None = None,
+) -> list[str]:
+    """
+    Find any bits of the given article_title across WIKI_DIR
+    and remove any block + link pointing to it.
 
-    for k, v in cats.items():
-        cat_labels.append(v["label"].lower())
+    Instead of scanning every file in WIKI_DIR, we look only at the
+    pages linked to the article in the link graph (see `link_graph.py`)
+    and the frontpage. Category index pages are rendered again
+    without the article from the category store.
+
+    The slugs in keep are left untouched: eg when an article is
+    edited, the pages it still links to keep listing it in their
+    "What links here" block. Pass the linked pages when they have been
+    looked up already, eg before the article's links were updated.
+
+    Each page is rewritten holding its article lock (see `article_locks.py`):
+    don't call this while holding the lock of the given article.
+
+    Return the categories the article has been removed from, so the
+    caller can tell if the frontpage lists it (see `build_front_index`).
+    """
+
+    # avoid a circular import, as build_category_index
+    # imports views.py, which imports this module
+    from app.build_category_index import remove_from_categories
 
     # check first if article is in footerlink list
     footer_links = config["wiki"]["footer_links"]
@@ -259,163 +343,118 @@ async def remove_article_traces(article_title: str) -> None:
     for k, v in footer_links.items():
         footer_labels.append(v["label"])
 
+    removed_cats = []
+
     if article_title not in footer_labels:
 
         pattern = slugify(article_title)
-        filepaths = search_file_content(pattern)
-        print(f"remove-traces :: filepaths => {filepaths}")
-
-        # map over each filepath and remove matched bits
-        # based on the template style of each article.
-        # eg, cat-index templates might be different than
-        # an article template, and each match needs to remove
-        # the correct DOM element in full.
 
-        # - cat-index + index page => event-item > article.id
-        # - collaborators => match <a> by href, go up one level to target parent <li>
-        # - footer => what links here => ""
-
-        for filepath in filepaths:
-            print(f"remove-traces from => {filepath}")
-            filename = Path(filepath).stem
-
-            article_file = Path(f"./{WIKI_DIR}/{filename}.html")
-            if article_file.is_file():
-                article_html = article_file.read_text()
-                soup = BeautifulSoup(article_html, "lxml")
-
-                # update cat-index pages if any is matching
-                if filename in cat_labels:
-                    snippets = soup.select(f"#{pattern}")
-
-                    if len(snippets) > 0:
-                        for snippet in snippets:
-                            snippet.decompose()
+        # - category index pages
+        removed_cats = await remove_from_categories(pattern)
 
-                        # write updated cat-index HTML back to disk
-                        article_html = str(soup.prettify())
-                        task = write_to_disk(filename, article_html, sem)
-                        tasks_html.append(asyncio.ensure_future(task))
+        # - pages linking to the article
+        # - pages the article links to, listing it in "What links here"
+        # - frontpage
+        if linked is None:
+            linked = get_linked_pages(pattern)
 
-                else:
-                    # update links, eg footer > meta > what-links-here
-                    # and collaborator article page
-
-                    print(f"remove-traces :: remove links from article => {filepath}")
+        filenames = [*linked, "index"]
+        filenames = [
+            filename
+            for filename in dict.fromkeys(filenames)
+            if filename not in keep and filename != pattern
+        ]
 
-                    links = soup.find_all("a")
-                    snippets = [
-                        link
-                        for link in links
-                        if "href" in link.attrs and link.attrs["href"].startswith(f"/{pattern}")
-                    ]
+        print(f"remove-traces :: filenames => {filenames}")
 
-                    if len(snippets) > 0:
-                        for snippet in snippets:
-                            parent = snippet.parent
-                            if snippet.name == "a" and parent.name == "li":
-                                parent.decompose()
+        # map over each page and remove matched bits:
+        # - collaborators => match <a> by href, go up one level to target parent <li>
+        # - footer => what links here => ""
+        # read and write back each page holding its lock, so a rebuild
+        # of it running at the same time is not overwritten
 
-                        # write updated cat-index HTML back to disk
-                        article_html = str(soup.prettify())
-                        task = write_to_disk(filename, article_html, sem)
-                        tasks_html.append(asyncio.ensure_future(task))
+        for filename in filenames:
+            async with article_lock(filename):
+                await remove_traces_from_page(filename, pattern)
 
-    await asyncio.gather(*tasks_html)
+    return removed_cats
 
 
-def extract_title_from_URL(links: list[Type[Tag]]) -> list[str]:
+async def remove_traces_from_page(filename: str, pattern: str) -> None:
     """
-    Parse links from the body of the article and
-    extract title from it. Then use it to fetch the page via MW's APIs.
-    We rely on the MW convention of WikiLinks, eg:
-    the user types the title of a page inside {{ }}
-    IMPORTANT: this break in the case a link has a custom title / label.
-    We try to handle this case by comparing the href of the link with
-    its title, and make the title matching the href
+    Remove every link pointing to the given slug pattern
+    from the given page, together with its parent <li>.
     """
 
-    titles = []
-
-    for link in links:
-        if "href" in link.attrs and not link.attrs["href"].startswith("http"):
-            url = None
-            title = None
+    article_file = Path(f"./{WIKI_DIR}/{filename}.html")
+    if not article_file.is_file():
+        return
 
-            url = link.attrs["href"][1:]
+    article_html = article_file.read_text()
+    if pattern not in article_html:
+        return
 
-            if "title" in link.attrs:
-                title = link.attrs["title"]
-            else:
-                return []
+    print(f"remove-traces from => {filename}.html")
 
-            # url and title easily match
-            if url == slugify(title):
-                titles.append(title)
+    soup = BeautifulSoup(article_html, "lxml")
 
-            else:
-                # title is not 1:1 with url (eg custom title)
-                # let's adjust title to match with url
-                url_tokens = url.split("-")
-                title_tokens = title.split(" ")
+    # update links, eg footer > meta > what-links-here
+    # and collaborator article page
 
-                new_title = []
-                for idx, token in enumerate(title_tokens):
-                    try:
-                        if slugify(token) == url_tokens[idx]:
-                            new_title.append(token)
-                    except IndexError:
-                        pass
+    # body links point to `/<slug>`, the ones in
+    # "What links here" to `<slug>`
+    links = soup.find_all("a")
+    snippets = [
+        link
+        for link in links
+        if "href" in link.attrs and get_href_slug(link.attrs["href"]) == pattern
+    ]
 
-                if len(new_title) > 0:
-                    t = " ".join(new_title)
-                    titles.append(t)
+    if len(snippets) > 0:
+        for snippet in snippets:
+            parent = snippet.parent
+            if snippet.name == "a" and parent.name == "li":
+                parent.decompose()
 
-    return titles
+        # write updated HTML back to disk
+        article_html = str(soup.prettify())
+        await write_to_disk(filename, article_html)
 
 
 async def update_backlinks(
-    article: dict[str, list[str] | list[dict[str, str]]]
+    links: list[dict[str, str]], skip: Collection[str] = ()
 ) -> None:
     """
-    Scan article for wiki links and rebuild each
-    article it points to.
-    This is an attempt to re-add all the backlinks
-    in the articles we are re-building when we are
-    either creating a new article or restoring a
-    deleted one and we are removing backlinks
-    from them.
+    Rebuild the given linked articles (each one with a title and
+    a slug), so their "What links here" block is up-to-date.
+
+    Pass the links an article gained or lost since its last build
+    (see `link_graph.diff_links`): the articles it still links to
+    list it already. Each article is rebuilt once, at most
+    BACKLINKS_MAX_IN_FLIGHT at the same time; the slugs in skip
+    (eg articles being rebuilt anyway) are left out.
     """
 
-    soup = BeautifulSoup(article["html"], "lxml")
-    links = soup.find_all("a")
-    titles = extract_title_from_URL(links)
-
-    ENV = os.getenv("ENV")
-    context = create_context(ENV)
-    timeout = httpx.Timeout(10.0, connect=60.0, read=60.0)
-    sem = asyncio.Semaphore(int(os.getenv("SEMAPHORE")))
+    targets = {
+        link["slug"]: link["title"] for link in links if link["slug"] not in skip
+    }
 
-    template = get_template("article")
-
-    async with httpx.AsyncClient(verify=context, timeout=timeout) as client:
-        build_tasks = []
-
-        if len(titles) > 0:
-            for title in titles:
-                build_task = make_article(title, client)
-                build_tasks.append(asyncio.ensure_future(build_task))
+    if len(targets) == 0:
+        return
 
-                articles = await asyncio.gather(*build_tasks)
+    print(f"update-backlinks => {len(targets)} articles")
 
-                articles = [item for item in articles if item is not None]
+    sem = asyncio.Semaphore(BACKLINKS_MAX_IN_FLIGHT)
+    template = get_template("article")
+    client = get_client()
 
-            save_tasks = []
-            for article in articles:
-                filepath = f"{article['slug']}"
+    # rebuild each article holding its lock (see `article_locks.py`),
+    # so an edit of it running at the same time is not overwritten
+    async def rebuild(slug: str, title: str) -> None:
+        async with sem, article_lock(slug):
+            article = await make_article(title, client)
 
-                task = save_article(article, filepath, template, sem)
-                save_tasks.append(asyncio.ensure_future(task))
+            if article is not None:
+                await save_article(article, article["slug"], template, None)
 
-            # write all articles to disk
-            await asyncio.gather(*save_tasks)
+    await asyncio.gather(*[rebuild(slug, title) for slug, title in targets.items()])
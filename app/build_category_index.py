@@ -3,17 +3,22 @@ import os
 from pathlib import Path
 from typing import Any
 
-import httpx
-from bs4 import BeautifulSoup
-
-from app.build_article import make_article
-from app.fetch import create_context, query_continue
+from slugify import slugify
+
+from app.article_store import get_article, make_store, prefetch_articles
+from app.category_store import (
+    get_category_items,
+    is_category_stored,
+    is_translation,
+    remove_category_item,
+    set_category_items,
+    upsert_category_item,
+)
+from app.fetch import get_client, query_continue
 from app.file_ops import write_to_disk
 from app.log_to_file import main as log
 from app.read_settings import main as read_settings
-from app.views.template_utils import get_template
 from app.views.views import (
-    make_article_event,
     make_article_index,
     make_collaborators_index,
     make_event_index,
@@ -75,92 +80,110 @@ async def get_category(
         "redirects": "1",
     }
 
-    context = create_context(ENV)
-    timeout = httpx.Timeout(10.0, connect=60.0, read=60.0)
-    async with httpx.AsyncClient(verify=context, timeout=timeout) as client:
+    client = get_client()
 
-        # -- get full list of entries from category
-        data = {cat: []}
-        async for response in query_continue(client, URL, params):
-            response = response["categorymembers"]
+    # -- get full list of entries from category
+    data = {cat: []}
+    async for response in query_continue(client, URL, params):
+        response = response["categorymembers"]
 
-            if len(response) > 0 and "missing" in response[0]:
-                title = response[0]["title"]
-                print(f"the page could not be found => {title}")
+        if len(response) > 0 and "missing" in response[0]:
+            title = response[0]["title"]
+            print(f"the page could not be found => {title}")
 
-            else:
-                data[cat].extend(response)
+        else:
+            data[cat].extend(response)
 
     return data
 
 
 async def make_category_index(
     cat: str,
+    store: dict[str, asyncio.Task] | None = None,
 ) -> dict[str, list[str] | list[dict[str, str]]] | None:
     """
     Build Index page of the specified category.
+    Pass a build-scoped article store to reuse articles
+    already built in the same run (see `app/article_store.py`).
     """
 
     cat_key, cat_label = check_if_cat_exists(cat)
 
-    langs = config["wiki"]["langs"]
-
     category_data = await get_category(ENV, URL, cat_key)
     articles = category_data[cat_key]
 
-    context = create_context(ENV)
-    timeout = httpx.Timeout(10.0, connect=60.0, read=60.0)
-    async with httpx.AsyncClient(verify=context, timeout=timeout) as client:
-
-        art_tasks = []
-        for article in articles:
-            # filter out translated article
-            title = article["title"]
-            lang_stem = title.split("/")[-1]
-
-            if lang_stem not in langs:
-                task = make_article(article["title"], client)
-                art_tasks.append(asyncio.ensure_future(task))
-
-        prepared_articles = await asyncio.gather(*art_tasks)
-        await log(
-            "info",
-            f"prep-articles {cat_key} => un-filtered {len(prepared_articles)}\n",
-            sem=None,
-        )
+    client = get_client()
 
-        prepared_articles = [item for item in prepared_articles if item is not None]
-        await log(
-            "info",
-            f"prep-articles {cat_key} => filtered {len(prepared_articles)}\n",
-            sem=None,
-        )
+    # filter out translated article
+    titles = [
+        article["title"] for article in articles if not is_translation(article["title"])
+    ]
+
+    if store is None:
+        store = make_store()
+    prefetch_articles(titles, client, store)
+
+    art_tasks = []
+    for title in titles:
+        task = get_article(title, client, store)
+        art_tasks.append(asyncio.ensure_future(task))
+
+    prepared_articles = await asyncio.gather(*art_tasks)
+    await log(
+        "info",
+        f"prep-articles {cat_key} => un-filtered {len(prepared_articles)}\n",
+        sem=None,
+    )
+
+    prepared_articles = [item for item in prepared_articles if item is not None]
+    await log(
+        "info",
+        f"prep-articles {cat_key} => filtered {len(prepared_articles)}\n",
+        sem=None,
+    )
+
+    # -- keep one record per article, used by `update_categories`
+    #    to update the index page without fetching every article again
+    set_category_items(cat_key, prepared_articles)
+
+    return await render_category_index(cat_key, cat_label)
+
+
+async def render_category_index(
+    cat_key: str, cat_label: str
+) -> dict[str, list[str] | list[dict[str, str]]] | None:
+    """
+    Render the Index page of the specified category
+    from the article records in the category store.
+    """
 
-        # -- prepare per-template category article
-        article = None
+    articles = get_category_items(cat_key)
 
-        if cat_key == "Event":
-            article = await make_event_index(prepared_articles, cat_key, cat_label)
+    # -- prepare per-template category article
+    article = None
 
-        elif cat_key == "Collaborators":
-            article = await make_collaborators_index(
-                prepared_articles, cat_key, cat_label
-            )
+    if cat_key == "Event":
+        article = await make_event_index(articles, cat_key, cat_label)
 
-        elif cat_key == "Publishing":
-            article = await make_publishing_index(prepared_articles, cat_key, cat_label)
+    elif cat_key == "Collaborators":
+        article = await make_collaborators_index(articles, cat_key, cat_label)
 
-        elif cat_key == "Tools":
-            article = await make_tool_index(prepared_articles, cat_key, cat_label)
+    elif cat_key == "Publishing":
+        article = await make_publishing_index(articles, cat_key, cat_label)
 
-        elif cat_key == "Article":
-            article = await make_article_index(prepared_articles, cat_key, cat_label)
+    elif cat_key == "Tools":
+        article = await make_tool_index(articles, cat_key, cat_label)
 
-        return article
+    elif cat_key == "Article":
+        article = await make_article_index(articles, cat_key, cat_label)
+
+    return article
 
 
 async def build_categories(
-    categories: list[str], sem: asyncio.Semaphore | None
+    categories: list[str],
+    sem: asyncio.Semaphore | None,
+    store: dict[str, asyncio.Task] | None = None,
 ) -> None:
     """
     Build index page for all categories.
@@ -168,7 +191,7 @@ async def build_categories(
 
     cat_tasks = []
     for cat in categories:
-        task = make_category_index(cat)
+        task = make_category_index(cat, store)
         cat_tasks.append(asyncio.ensure_future(task))
 
     prepared_category_indexes = await asyncio.gather(*cat_tasks)
@@ -191,81 +214,64 @@ async def update_categories(
     """
     Update Index page for each category defined in settings.toml.
     We don't rebuild the whole Index page from scratch by parsing every
-    article in it. Rather, we just update the article's info
-    in the Index page that has triggered the update_categories function.
+    article in it. Rather, we update the article's record in the
+    category store and render the Index page again from it.
     """
 
-    # - select index-template by `cat`
-    # - build updated article item HTML snippet for category index
-    # - use bs4 to search and replace previous article-item with new one
-
     cat_tasks_html = []
 
-    cat_label = None
+    index_cat = config["wiki"]["frontpage"]["category"]
+
     for cat in article["metadata"]["categories"]:
 
+        # the frontpage category has no Index page, but its records
+        # make the highlights of the front index page (translations
+        # are left out by `upsert_category_item`, as in `update_highlights`)
+        if cat == slugify(index_cat) and is_category_stored(index_cat):
+            upsert_category_item(index_cat, article)
+
         cat_key, cat_label = check_if_cat_exists(cat)
 
         if cat_label:
-            # if article is an `event` we need to do more work
-            # on the data structure before we pass it to the template.
-            # do it here.
-            prepared_article = article
-            if cat == "event":
-                prepared_article = make_article_event(article)
-
-            # make new snippet for updated article
-            template = get_template(f"partials/{cat}-item")
-            snippet_new = template.render(article=prepared_article)
-
-            # make bs4 object out of the HTML string
-            snippet_new = BeautifulSoup(snippet_new, "lxml")
-
             index_doc = cat_label.lower()
 
-            # get existing cat-index HTML
-            if not Path(f"./{WIKI_DIR}/{index_doc}.html").exists():
-                # cat-event HTML file does not exist. let's build it from scratch
-                # and write it to disk w/o doing the HTML-swap step
-                # (as unnecessary at this point).
+            if (
+                not Path(f"./{WIKI_DIR}/{index_doc}.html").exists()
+                or not is_category_stored(cat_key)
+            ):
+                # cat-index HTML file or its records do not exist yet:
+                # let's build it from scratch, which also fills the
+                # category store with every article in it.
                 cat_index = await make_category_index(cat)
-                filepath = f"{cat_index['slug']}"
-                await write_to_disk(filepath, cat_index["html"], sem=None)
 
-                break
+            else:
+                upsert_category_item(cat_key, article)
+                cat_index = await render_category_index(cat_key, cat_label)
+
+            task = write_to_disk(cat_index["slug"], cat_index["html"], sem=None)
+            cat_tasks_html.append(asyncio.ensure_future(task))
 
-            index_old = Path(f"./{WIKI_DIR}/{index_doc}.html").read_text()
+    await asyncio.gather(*cat_tasks_html)
 
-            # find cat index's list item (article snippet) matching
-            # against given article's slug
-            soup = BeautifulSoup(index_old, "lxml")
 
-            # replace matched article snippet with newer one
-            article_snippet = soup.select(f"#{article['slug']}")
-            if len(article_snippet) > 0:
-                for item in article_snippet:
-                    item.replace_with(snippet_new)
+async def remove_from_categories(article_slug: str) -> list[str]:
+    """
+    Remove the given article from every category Index page it is listed in,
+    and return the list of categories it has been removed from.
+    """
 
-                # write updated cat-index HTML back to disk
-                cat_html = str(soup.prettify())
-                task = write_to_disk(index_doc, cat_html, sem=None)
-                cat_tasks_html.append(asyncio.ensure_future(task))
+    cats = config["wiki"]["categories"]
 
-            else:
-                # if no matching from the old snippet,
-                # it means we need to insert the article snippet
-                # into the page.
-                # do we try to insert the snippet in the correct position
-                # in the cat index list? no, we just rebuild the entire
-                # page. easier and more effective than otherwise having to
-                # compare against all the other article snippets and find
-                # in which position the newly created or restored
-                # article snippet should be inserted.
+    removed_cats = remove_category_item(article_slug)
 
-                cat_index = await make_category_index(cat)
-                filepath = f"{cat_index['slug']}"
-                await write_to_disk(filepath, cat_index["html"], sem=None)
+    cat_tasks_html = []
+    for cat_key in removed_cats:
+        cat_index = await render_category_index(cat_key, cats[cat_key]["label"])
 
-                break
+        if cat_index is not None:
+            task = write_to_disk(cat_index["slug"], cat_index["html"], sem=None)
+            cat_tasks_html.append(asyncio.ensure_future(task))
 
     await asyncio.gather(*cat_tasks_html)
+
+    return removed_cats
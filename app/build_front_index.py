@@ -1,67 +1,187 @@
-import os
-from pathlib import Path
+import asyncio
+import json
 
-from bs4 import BeautifulSoup
 from slugify import slugify
 
+from app.article_store import get_article, make_store, prefetch_articles
 from app.build_article import save_article
+from app.category_store import (
+    get_category_items,
+    is_category_stored,
+    is_translation,
+    set_category_items,
+)
+from app.db import get_db
+from app.fetch import fetch_category, get_client
 from app.read_settings import main as read_settings
 from app.views.template_utils import get_template
 from app.views.views import make_front_index
 
+config = read_settings()
+
+
+def get_intro() -> dict[str, list[str] | list[dict[str, str]]] | None:
+    """
+    Return the stored intro section of the front index page,
+    ie the frontpage article, if any.
+    """
+
+    db = get_db()
+    row = db.execute("SELECT data FROM front_sections WHERE name = 'intro'").fetchone()
+
+    if row is None:
+        return None
+
+    return json.loads(row["data"])
+
+
+async def update_intro(
+    store: dict[str, asyncio.Task] | None = None, revid: int | None = None
+) -> dict[str, list[str] | list[dict[str, str]]] | None:
+    """
+    Fetch the frontpage article, store it as the intro section
+    of the front index page and return it.
+
+    Pass the revid of the frontpage article, if known, to reuse the
+    one in the store only if it has been built from that revision.
+    """
+
+    index_art = config["wiki"]["frontpage"]["article"]
+
+    article = await get_article(index_art, get_client(), store, revid)
+
+    if article is not None:
+        db = get_db()
+        db.execute(
+            "INSERT OR REPLACE INTO front_sections (name, data) VALUES ('intro', ?)",
+            (json.dumps(article),),
+        )
+        db.commit()
+
+    return article
+
+
+async def update_highlights(store: dict[str, asyncio.Task] | None = None) -> None:
+    """
+    Fetch every article of the frontpage category and store their
+    records (see `app/category_store.py`), used as the highlights
+    section of the front index page.
+
+    Afterwards, `update_categories` keeps the records up-to-date
+    one article at a time.
+    """
+
+    index_cat = config["wiki"]["frontpage"]["category"]
+
+    client = get_client()
+
+    # list of articles w/ `highlight` cat
+    data = await fetch_category(index_cat, client)
+
+    # filter away translations
+    titles = [
+        article["title"] for article in data if not is_translation(article["title"])
+    ]
+
+    if store is None:
+        store = make_store()
+    prefetch_articles(titles, client, store)
+
+    art_tasks = []
+    for title in titles:
+        task = get_article(title, client, store)
+        art_tasks.append(asyncio.ensure_future(task))
+
+    highlight_articles = await asyncio.gather(*art_tasks)
+    highlight_articles = [item for item in highlight_articles if item is not None]
+
+    set_category_items(index_cat, highlight_articles)
+
 
 async def build_front_index(
-    article_title: str | None, article_cats: list[str] | None
+    article_title: str | None,
+    article_cats: list[str] | None,
+    store: dict[str, asyncio.Task] | None = None,
+    revid: int | None = None,
 ) -> None:
     """
     Build front index page.
 
-    Check if:
-    - article title = settings.wiki.frontpage, else if
-    - article_cats is either 'highlight' or 'event',
-    - else if article has been deleted, do another check
+    The page is made of three sections, each with its own inputs:
+    - intro: the frontpage article, stored in the build database
+    - highlights: the records of the frontpage category articles
+    - upcoming events: the records of the Event articles
 
-    If so update front index page and write it to disk.
+    Check if:
+    - article title and article_cats are None (full build): fetch
+      the intro and the highlights again, else if
+    - article title = settings.wiki.frontpage: fetch the intro again, else if
+    - article_cats is either 'highlight' or 'event', or
+    - article has been deleted (article_cats is None)
+
+    If so update front index page from the stored sections and
+    write it to disk. Records are kept up-to-date as articles
+    change, so only the intro is ever fetched from MediaWiki.
+
+    Pass the store and the revid of the given article, to reuse
+    it as intro instead of fetching it again (see `update_intro`).
     """
 
-    WIKI_DIR = Path(os.getenv("WIKI_DIR"))
-    config = read_settings()
-
     index_art = config["wiki"]["frontpage"]["article"]
     index_cat = config["wiki"]["frontpage"]["category"]
 
-    article = None
+    intro = None
 
     if article_title is None and article_cats is None:
-        article = await make_front_index(index_art, index_cat)
+        intro = await update_intro(store)
+        await update_highlights(store)
 
     elif article_title == index_art:
-        # check title
-        article = await make_front_index(index_art, index_cat)
+        intro = await update_intro(store, revid)
+
+    elif article_cats is not None and not any(
+        cat in [slugify(index_cat), "event"] for cat in article_cats
+    ):
+        return
 
-    elif article_cats is None:
-        # this handles the case where we delete an article
-        # and only have access to its title, no categories.
-        # therefore we look if either the upcoming events
-        # or highlights section match the article-title
+    await render_front_index(intro)
 
-        article_html = Path(f"./{WIKI_DIR}/index.html").read_text()
-        soup = BeautifulSoup(article_html, "lxml")
 
-        pattern = slugify(article_title)
-        snippets = soup.select(f"#{pattern}")
+async def render_front_index(
+    intro: dict[str, list[str] | list[dict[str, str]]] | None = None
+) -> None:
+    """
+    Render the front index page from its stored sections (see
+    `build_front_index`) and write it to disk. Pass intro to use
+    the frontpage article just fetched, instead of the stored one.
+
+    Sections not stored yet are fetched first.
+    """
+
+    index_art = config["wiki"]["frontpage"]["article"]
+    index_cat = config["wiki"]["frontpage"]["category"]
+
+    if intro is None:
+        intro = get_intro() or await update_intro()
+
+    if not is_category_stored(index_cat):
+        await update_highlights()
 
-        if len(snippets) > 0:
-            article = await make_front_index(index_art, index_cat)
+    if intro is None:
+        print(f"make-frontindex err => {index_art} not found")
+        return
 
-    else:
-        for cat in article_cats:
-            if cat in ["event", "highlight"]:
-                article = await make_front_index(index_art, index_cat)
+    if not is_category_stored("Event"):
+        print("make-frontindex err => the Event index page has not been built yet.")
+        return
+
+    highlights = get_category_items(index_cat)
+    events = get_category_items("Event")
+
+    article = await make_front_index(intro, highlights, events)
 
     # write to disk
-    if article is not None:
-        template = get_template("index")
+    template = get_template("index")
 
-        filepath = f"{article['slug']}"
-        await save_article(article, filepath, template, sem=None)
+    filepath = f"{article['slug']}"
+    await save_article(article, filepath, template, sem=None)
@@ -0,0 +1,130 @@
+import hashlib
+from typing import Any
+
+from slugify import slugify
+from unidecode import unidecode
+
+from app.db import get_db
+from app.read_settings import main as read_settings
+
+config = read_settings()
+
+
+def make_article_slug(title: str) -> str:
+    """
+    Return the output slug of the given article title,
+    same as done by `make_article`.
+    """
+
+    return slugify(unidecode(title))
+
+
+def get_manifest() -> dict[str, dict[str, Any]]:
+    """
+    Return every manifest entry, keyed by output slug.
+    """
+
+    db = get_db()
+    rows = db.execute("SELECT * FROM manifest").fetchall()
+
+    return {row["slug"]: dict(row) for row in rows}
+
+
+def get_creation_timestamps(titles: list[str]) -> dict[str, str]:
+    """
+    Return the creation timestamp (as returned by MediaWiki)
+    of the given titles, if known, keyed by title.
+    """
+
+    slugs = {make_article_slug(title): title for title in titles}
+
+    db = get_db()
+    rows = db.execute(
+        "SELECT slug, title, creation FROM manifest"
+        f" WHERE slug IN ({', '.join('?' for _ in slugs)})",
+        list(slugs.keys()),
+    ).fetchall()
+
+    return {
+        slugs[row["slug"]]: row["creation"]
+        for row in rows
+        if row["creation"] is not None and row["title"] == slugs[row["slug"]]
+    }
+
+
+def update_manifest(
+    article: dict[str, list[str] | list[dict[str, str]]], document: str
+) -> None:
+    """
+    Record the given article's revision data and the hash
+    of its rendered output in the build manifest.
+    """
+
+    metadata = article.get("metadata", {})
+    timestamps = metadata.get("timestamps", {})
+
+    db = get_db()
+    db.execute(
+        "INSERT OR REPLACE INTO manifest"
+        " (slug, title, pageid, revid, last_modified, creation, hash)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            article["slug"],
+            article["title"],
+            metadata.get("id"),
+            metadata.get("revid"),
+            metadata.get("last_modified"),
+            timestamps.get("creation"),
+            hashlib.sha256(document.encode()).hexdigest(),
+        ),
+    )
+    db.commit()
+
+
+def remove_from_manifest(article_title: str) -> None:
+    """
+    Remove the manifest entry of the given article title.
+    """
+
+    slug = make_article_slug(article_title)
+
+    db = get_db()
+    db.execute("DELETE FROM manifest WHERE slug = ?", (slug,))
+    db.commit()
+
+
+def diff_manifest(
+    pages: dict[str, dict[str, Any]], manifest: dict[str, dict[str, Any]]
+) -> tuple[list[str], list[str]]:
+    """
+    Compare the revision data of the given pages (keyed by title, as
+    returned by `fetch_category_revisions`) against the manifest.
+
+    Return the list of titles whose revision has changed (or are new)
+    and the list of titles in the manifest that are not listed in any
+    of the given pages. The latter might be gone from the wiki, or just
+    not be in any category (eg About, or an article taken out of its
+    category): check which ones are gone with `fetch_missing_titles`.
+
+    Manifest entries whose slug does not derive from their title
+    (eg the frontpage, saved as `index`) and the styles page are
+    never returned as unlisted.
+    """
+
+    changed = []
+    for title, page in pages.items():
+        entry = manifest.get(make_article_slug(title))
+        if entry is None or entry["revid"] != page["lastrevid"]:
+            changed.append(title)
+
+    unlisted = []
+    for slug, entry in manifest.items():
+        title = entry["title"]
+        if (
+            title not in pages
+            and slug == make_article_slug(title)
+            and title != config["wiki"]["stylespage"]
+        ):
+            unlisted.append(title)
+
+    return changed, unlisted
@@ -2,24 +2,148 @@ import asyncio
 import os
 import time
 
-import httpx
 from dotenv import load_dotenv
-
-from app.build_article import make_article, save_article
-from app.build_category_index import build_categories, get_category
-from app.build_front_index import build_front_index
+from slugify import slugify
+
+from app.article_store import get_article, make_store, prefetch_articles
+from app.build_article import (
+    delete_article,
+    remove_article_traces,
+    save_article,
+    update_backlinks,
+)
+from app.build_category_index import (
+    build_categories,
+    get_category,
+    update_categories,
+)
+from app.build_front_index import (
+    build_front_index,
+    render_front_index,
+    update_intro,
+)
+from app.build_manifest import diff_manifest, get_manifest
 from app.copy_assets import main as copy_assets
-from app.fetch import create_context
+from app.fetch import (
+    close_client,
+    fetch_category_revisions,
+    fetch_missing_titles,
+    get_client,
+)
+from app.file_ops import reset_write_stats, write_stats
+from app.link_graph import diff_links
+from app.process_pool import close_pool, start_pool
 from app.read_settings import main as read_settings
-from app.views.template_utils import get_template
+from app.views.template_utils import get_template, precompile_templates
 
 load_dotenv()
 
 
-async def main(ENV: str | None, URL: str | None) -> None:
+async def build_incremental(
+    cats: dict[str, dict[str, str | bool]], client, sem: asyncio.Semaphore
+) -> None:
+    """
+    Rebuild only the articles whose revision has changed since the last
+    build (as recorded in the build manifest), and delete the ones that
+    have vanished from the wiki.
+
+    We ask MediaWiki only for the revision metadata of each category,
+    then run for every changed article the same set of operations
+    the UDP server does when receiving an edit message.
+    """
+
+    pages = {}
+    for k, v in cats.items():
+        if v["parse"]:
+            cat_pages = await fetch_category_revisions(k, client)
+            pages.update(cat_pages)
+
+    manifest = get_manifest()
+    changed, unlisted = diff_manifest(pages, manifest)
+
+    # articles not listed in any category might still exist
+    # (eg About, or an article taken out of its category)
+    vanished = await fetch_missing_titles(unlisted, client)
+
+    print(
+        f"incremental build => {len(pages)} articles, "
+        f"{len(changed)} changed, {len(vanished)} vanished"
+    )
+
+    template = get_template("article")
+    update_front = len(vanished) > 0
+
+    store = make_store()
+    prefetch_articles(changed, client, store)
+
+    # rebuild an article of the store if it has an older
+    # revision than the one listed by MediaWiki
+    art_tasks = []
+    for title in changed:
+        task = get_article(title, client, store, pages[title]["lastrevid"])
+        art_tasks.append(asyncio.ensure_future(task))
+
+    prepared_articles = await asyncio.gather(*art_tasks)
+    articles = [item for item in prepared_articles if item is not None]
+
+    # linked articles to rebuild once every changed article is saved
+    backlinks = []
+
+    for article in articles:
+        links_diff = diff_links(article["slug"], article["metadata"]["links"])
+        kept = [link["slug"] for link in links_diff["kept"]]
+
+        removed_cats = await remove_article_traces(article["title"], keep=kept)
+        await update_categories(article)
+        backlinks.extend([*links_diff["added"], *links_diff["removed"]])
+
+        # the categories it has been removed from count too,
+        # eg an article taken out of the highlights
+        art_cats = [
+            *article["metadata"]["categories"],
+            *[slugify(cat) for cat in removed_cats],
+        ]
+        for cat in art_cats:
+            if cat in ["event", "highlight"]:
+                update_front = True
+
+        filepath = f"{article['slug']}"
+        await save_article(article, filepath, template, sem)
+
+    await update_backlinks(backlinks, skip=[article["slug"] for article in articles])
+
+    for title in vanished:
+        # remove its traces first: they are looked up
+        # in the link graph, which delete_article clears
+        await remove_article_traces(title)
+        await delete_article(title)
+
+    # -- build front-index page, once for all changes: the records of
+    #    the changed articles are up-to-date already, so we only fetch
+    #    the frontpage article again
+    if update_front:
+        intro = await update_intro(store)
+        await render_front_index(intro)
+
+
+def print_write_stats() -> None:
+    """
+    Print how many files the build has actually changed on disk.
+    """
+
+    print(
+        f"build => {write_stats['changed']} files changed, "
+        f"{write_stats['unchanged']} unchanged"
+    )
+
+
+async def main(ENV: str | None, URL: str | None, incremental: bool = False) -> None:
     """
     This function (re-)build the entire wiki by fetching a set of specific
-    pages from the MediaWiki instance
+    pages from the MediaWiki instance.
+
+    If incremental is True, only the articles that changed since the
+    last build are fetched and rebuilt, see `build_incremental`.
     """
 
     # / summer academies
@@ -32,6 +156,28 @@ async def main(ENV: str | None, URL: str | None) -> None:
 
     cats = config["wiki"]["categories"]
 
+    # add semaphore as when running
+    # save_article => write_file_to_disk
+    # we might get back an error like "too many files open"
+    # https://github.com/Tinche/aiofiles/issues/83#issuecomment-761208062
+    sem = asyncio.Semaphore(int(os.getenv("SEMAPHORE")))
+
+    precompile_templates()
+    reset_write_stats()
+
+    # parse and render articles in worker processes, if BUILD_WORKERS is set
+    start_pool()
+
+    if incremental:
+        client = get_client()
+        await build_incremental(cats, client, sem)
+        await close_client()
+        close_pool()
+
+        copy_assets()
+        print_write_stats()
+        return
+
     cat_tasks = []
     for k, v in cats.items():
         if v["parse"]:
@@ -40,57 +186,58 @@ async def main(ENV: str | None, URL: str | None) -> None:
 
     articles = await asyncio.gather(*cat_tasks)
 
-    context = create_context(ENV)
-    timeout = httpx.Timeout(10.0, connect=60.0, read=60.0)
+    # every article is fetched and parsed once per build, and shared
+    # between the category, category index and front index steps
+    store = make_store()
 
-    # add semaphore as when running
-    # save_article => write_file_to_disk
-    # we might get back an error like "too many files open"
-    # https://github.com/Tinche/aiofiles/issues/83#issuecomment-761208062
-    sem = asyncio.Semaphore(int(os.getenv("SEMAPHORE")))
-
-    async with httpx.AsyncClient(verify=context, timeout=timeout) as client:
+    client = get_client()
+    articles_index = []
 
-        articles_index = []
+    for category in articles:
+        cat = list(category.keys())[0]
 
-        for category in articles:
-            cat = list(category.keys())[0]
+        template = get_template(cat)
 
-            template = get_template(cat)
+        # fetch articles metadata in batches
+        titles = [article["title"] for v in category.values() for article in v]
+        prefetch_articles(titles, client, store)
 
-            # process single article
-            art_tasks = []
-            for k, v in category.items():
-                for article in v:
-                    task = make_article(article["title"], client)
-                    art_tasks.append(asyncio.ensure_future(task))
+        # process single article
+        art_tasks = []
+        for k, v in category.items():
+            for article in v:
+                task = get_article(article["title"], client, store)
+                art_tasks.append(asyncio.ensure_future(task))
 
-            prepared_articles = await asyncio.gather(*art_tasks)
-            print(f"articles: {len(prepared_articles)}")
+        prepared_articles = await asyncio.gather(*art_tasks)
+        print(f"articles: {len(prepared_articles)}")
 
-            articles = [item for item in prepared_articles if item is not None]
+        articles = [item for item in prepared_articles if item is not None]
 
-            articles_index.extend(articles)
+        articles_index.extend(articles)
 
-            save_tasks = []
-            for article in articles:
-                filepath = f"{article['slug']}"
+        save_tasks = []
+        for article in articles:
+            filepath = f"{article['slug']}"
 
-                task = save_article(article, filepath, template, sem)
-                save_tasks.append(asyncio.ensure_future(task))
+            task = save_article(article, filepath, template, sem)
+            save_tasks.append(asyncio.ensure_future(task))
 
-            # write all articles to disk
-            await asyncio.gather(*save_tasks)
+        # write all articles to disk
+        await asyncio.gather(*save_tasks)
 
-        # -- update category index
-        categories = [k.lower() for k, v in cats.items()]
-        await build_categories(categories, sem)
+    # -- update category index
+    categories = [k.lower() for k, v in cats.items()]
+    await build_categories(categories, sem, store)
 
-        # -- build front-index page
-        await build_front_index(article_title=None, article_cats=None)
+    # -- build front-index page
+    await build_front_index(article_title=None, article_cats=None, store=store)
+    await close_client()
+    close_pool()
 
-        # -- ahah
-        copy_assets()
+    # -- ahah
+    copy_assets()
+    print_write_stats()
 
 
 if __name__ == "__main__":
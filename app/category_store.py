@@ -0,0 +1,135 @@
+import json
+
+from app.db import get_db
+from app.read_settings import main as read_settings
+
+config = read_settings()
+
+
+def is_translation(title: str) -> bool:
+    """
+    Return True if the given title is a translated article
+    (eg `<title>/nl`), which category index pages leave out.
+    """
+
+    return title.split("/")[-1] in config["wiki"]["langs"]
+
+
+def make_category_item(
+    article: dict[str, list[str] | list[dict[str, str]]]
+) -> dict[str, str | dict]:
+    """
+    Return the compact record of the given article, keeping only
+    the fields used by the category index templates (see
+    `views/templates/partials/*-item.html`).
+    """
+
+    metadata = article["metadata"]
+
+    return {
+        "title": article["title"],
+        "slug": article["slug"],
+        "metadata": {
+            "displaytitle": metadata["displaytitle"],
+            "images": metadata["images"][:1],
+            "creation": metadata["creation"],
+            "timestamps": metadata["timestamps"],
+            "backlinks": metadata["backlinks"],
+            "parsed_metadata": metadata["parsed_metadata"],
+            "tool_repos": metadata["tool_repos"],
+        },
+    }
+
+
+def set_category_items(
+    cat: str, articles: list[dict[str, list[str] | list[dict[str, str]]]]
+) -> None:
+    """
+    Replace every record of the given category with the given articles,
+    and mark the category as stored.
+    """
+
+    db = get_db()
+    db.execute("INSERT OR IGNORE INTO categories (cat) VALUES (?)", (cat,))
+    db.execute("DELETE FROM category_items WHERE cat = ?", (cat,))
+    db.executemany(
+        "INSERT OR REPLACE INTO category_items (cat, slug, title, record)"
+        " VALUES (?, ?, ?, ?)",
+        [
+            (
+                cat,
+                article["slug"],
+                article["title"],
+                json.dumps(make_category_item(article)),
+            )
+            for article in articles
+        ],
+    )
+    db.commit()
+
+
+def upsert_category_item(
+    cat: str, article: dict[str, list[str] | list[dict[str, str]]]
+) -> None:
+    """
+    Add or update the record of the given article in the given category.
+    Translated articles are left out, as in `make_category_index`.
+    """
+
+    if is_translation(article["title"]):
+        return
+
+    db = get_db()
+    db.execute(
+        "INSERT OR REPLACE INTO category_items (cat, slug, title, record)"
+        " VALUES (?, ?, ?, ?)",
+        (
+            cat,
+            article["slug"],
+            article["title"],
+            json.dumps(make_category_item(article)),
+        ),
+    )
+    db.commit()
+
+
+def remove_category_item(slug: str) -> list[str]:
+    """
+    Remove the records of the given article slug from every category,
+    and return the list of categories it was part of.
+    """
+
+    db = get_db()
+    rows = db.execute(
+        "SELECT cat FROM category_items WHERE slug = ?", (slug,)
+    ).fetchall()
+    db.execute("DELETE FROM category_items WHERE slug = ?", (slug,))
+    db.commit()
+
+    return [row["cat"] for row in rows]
+
+
+def get_category_items(cat: str) -> list[dict[str, str | dict]]:
+    """
+    Return every record of the given category, ordered by title.
+    """
+
+    db = get_db()
+    rows = db.execute(
+        "SELECT record FROM category_items WHERE cat = ? ORDER BY title", (cat,)
+    ).fetchall()
+
+    return [json.loads(row["record"]) for row in rows]
+
+
+def is_category_stored(cat: str) -> bool:
+    """
+    Return True if every article of the given category has been
+    stored at least once (see `set_category_items`), even if the
+    category is empty now.
+    """
+
+    db = get_db()
+    row = db.execute("SELECT 1 FROM categories WHERE cat = ?", (cat,)).fetchone()
+
+    return row is not None
@@ -4,12 +4,15 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from app.file_ops import compress_assets
+
 load_dotenv()
 
 
 def main() -> None:
     """
-    Copy assets folder from root directory to WIKI_DIR.
+    Copy assets folder from root directory to WIKI_DIR,
+    and write the compressed versions of the assets worth it.
     """
 
     ASSETS_DIR = os.getenv("ASSETS_DIR")
@@ -19,3 +22,4 @@ def main() -> None:
     print(f"copied static assets to {dest_path}")
 
     shutil.copytree(input_path, dest_path, dirs_exist_ok=True)
+    compress_assets(dest_path)
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    slug TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    pageid INTEGER,
+    revid INTEGER,
+    last_modified TEXT,
+    creation TEXT,
+    hash TEXT
+);
+
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    target_title TEXT NOT NULL,
+    PRIMARY KEY (source, target)
+);
+
+CREATE INDEX IF NOT EXISTS links_target ON links (target);
+
+CREATE TABLE IF NOT EXISTS category_items (
+    cat TEXT NOT NULL,
+    slug TEXT NOT NULL,
+    title TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (cat, slug)
+);
+
+CREATE INDEX IF NOT EXISTS category_items_slug ON category_items (slug);
+
+CREATE TABLE IF NOT EXISTS categories (
+    cat TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS redirects (
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    PRIMARY KEY (kind, source)
+);
+
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    received REAL NOT NULL,
+    rcid INTEGER,
+    title TEXT NOT NULL,
+    msg TEXT NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS journal_processed ON journal (processed);
+
+CREATE UNIQUE INDEX IF NOT EXISTS journal_rcid ON journal (rcid);
+
+CREATE TABLE IF NOT EXISTS front_sections (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cursors (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (
+    slug UNINDEXED,
+    title,
+    body,
+    categories,
+    metadata,
+    timestamp UNINDEXED,
+    wordcount UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+connection = None
+
+
+def get_db() -> sqlite3.Connection:
+    """
+    Return the process-wide connection to the local build database
+    (`<DATA_DIR>/build.db`), creating the file and its tables on first use.
+
+    The database is shared between the UDP server, the CLI build commands
+    and the FastAPI app, so we use WAL mode to let readers and the writer
+    work at the same time.
+    """
+
+    global connection
+
+    if connection is None:
+        Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
+
+        connection = sqlite3.connect(
+            Path(DATA_DIR) / "build.db", timeout=30, check_same_thread=False
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+
+    return connection
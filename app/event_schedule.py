@@ -0,0 +1,103 @@
+import asyncio
+import heapq
+import os
+import time
+
+from dotenv import load_dotenv
+
+from app.build_category_index import render_category_index
+from app.build_front_index import get_intro, render_front_index
+from app.category_store import get_category_items, is_category_stored
+from app.file_ops import write_to_disk
+from app.read_settings import main as read_settings
+from app.views.views import get_event_timestamps
+
+load_dotenv()
+
+config = read_settings()
+
+# max number of seconds between two reads of the Event records,
+# to pick up the events added or changed in the meantime
+EVENTS_RELOAD = float(os.getenv("EVENTS_RELOAD", "60"))
+
+
+def make_boundaries(
+    events: list[dict[str, str | dict]], now: float
+) -> list[tuple[float, str]]:
+    """
+    Return a min-heap of the start and end datetimes still to come
+    of the given Event records, as (timestamp, event title) tuples:
+    the moments an event changes from upcoming to happening or past.
+    """
+
+    boundaries = []
+    for event in events:
+        article_ts = get_event_timestamps(event)
+
+        for k in ["start", "end"]:
+            if article_ts[k] is not None and article_ts[k] > now:
+                boundaries.append((article_ts[k], event["title"]))
+
+    heapq.heapify(boundaries)
+
+    return boundaries
+
+
+async def render_event_pages() -> None:
+    """
+    Render the Event index page and the front index page again from
+    the stored records, so the events are listed in the right section
+    (upcoming, happening, past). Nothing is fetched from MediaWiki.
+    """
+
+    event_label = config["wiki"]["categories"]["Event"]["label"]
+
+    cat_index = await render_category_index("Event", event_label)
+    if cat_index is not None:
+        await write_to_disk(cat_index["slug"], cat_index["html"], sem=None)
+
+    await render_front_index()
+
+
+async def watch_event_boundaries(lock: asyncio.Lock, stop_event: asyncio.Event) -> None:
+    """
+    Sleep until the next event start or end passes, then render the
+    Event index page and the front index page again (see
+    `render_event_pages`), holding the given lock.
+
+    The boundaries are read from the stored Event records at least
+    every EVENTS_RELOAD seconds.
+
+    Set stop_event to stop watching.
+    """
+
+    while not stop_event.is_set():
+        now = time.time()
+
+        boundaries = []
+        if is_category_stored("Event") and get_intro() is not None:
+            boundaries = make_boundaries(get_category_items("Event"), now)
+
+        timeout = EVENTS_RELOAD
+        if len(boundaries) > 0:
+            timeout = min(timeout, boundaries[0][0] - now)
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=max(0, timeout))
+
+        except asyncio.TimeoutError:
+            pass
+
+        passed = []
+        while len(boundaries) > 0 and boundaries[0][0] <= time.time():
+            passed.append(heapq.heappop(boundaries)[1])
+
+        if len(passed) > 0 and not stop_event.is_set():
+            print(f"event-schedule => {', '.join(dict.fromkeys(passed))} changed state")
+
+            try:
+                async with lock:
+                    await render_event_pages()
+
+            except Exception as e:
+                print(f"event-schedule err => {e}")
@@ -1,5 +1,7 @@
+import asyncio
 import os
 import ssl
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
@@ -8,6 +10,14 @@ from dotenv import load_dotenv
 from slugify import slugify
 
 from app.log_to_file import main as log
+from app.rate_limit import (
+    API_MAX_RETRIES,
+    bucket,
+    get_backoff,
+    get_in_flight,
+    get_retry_after,
+    retry_budget,
+)
 from app.read_settings import main as read_settings
 
 load_dotenv()
@@ -17,13 +27,40 @@ ENV = os.getenv("ENV")
 URL = os.getenv("BASE_URL")
 MEDIA_DIR = os.getenv("MEDIA_DIR")
 
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("HTTP2", "0") == "1"
+
+# ask MediaWiki to refuse our requests while its database replicas are
+# lagging behind by more than this number of seconds, see
+# <https://www.mediawiki.org/wiki/Manual:Maxlag_parameter>
+API_MAXLAG = os.getenv("API_MAXLAG", "5")
+
+# HTTP status codes and MediaWiki error codes worth retrying
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+RETRY_ERROR_CODES = ["maxlag", "ratelimited"]
+
 config = read_settings()
 
+# process-wide HTTP client, and the event loop it has been created in
+# (an httpx client can't be shared between event loops)
+http_client = None
+http_client_loop = None
+
+# transport of the process-wide HTTP client, if not the default one
+# (eg `bench.py` replaying recorded responses)
+http_transport = None
+
 
-def create_context(ENV: str | None) -> ssl.SSLContext | bool:
+@lru_cache
+def create_context(ENV: str | None) -> ssl.SSLContext:
     """
     Helper function to detect whether httpx needs to pass
     a custom TLS certificate (if running in `ENV=dev`), or not.
+
+    The context is created once per process, so the CA bundle
+    is not loaded again for each new client.
     """
 
     if ENV == "dev":
@@ -36,8 +73,143 @@ def create_context(ENV: str | None) -> ssl.SSLContext | bool:
         return context
 
     else:
-        # True use default CA bundle
-        return True
+        # default CA bundle
+        return httpx.create_ssl_context()
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide HTTP client used to talk to MediaWiki,
+    creating it on first use (or when running in a new event loop).
+
+    Sharing one client lets every request reuse the pool of open
+    (keep-alive) connections, instead of doing a new TCP and TLS
+    handshake for each client. Pool limits are set through
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE and HTTP_KEEPALIVE_EXPIRY;
+    set HTTP2=1 to use HTTP/2 (requires the h2 package).
+    """
+
+    global http_client, http_client_loop
+
+    loop = asyncio.get_running_loop()
+
+    if http_client is None or http_client.is_closed or http_client_loop is not loop:
+        http2 = HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+
+            except ImportError:
+                print("http-client => h2 is not installed, using HTTP/1.1")
+                http2 = False
+
+        http_client = httpx.AsyncClient(
+            verify=create_context(os.getenv("ENV")),
+            timeout=httpx.Timeout(10.0, connect=60.0, read=60.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+            transport=http_transport,
+        )
+        http_client_loop = loop
+
+    return http_client
+
+
+async def close_client() -> None:
+    """
+    Close the process-wide HTTP client, if any.
+    """
+
+    global http_client, http_client_loop
+
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+        http_client_loop = None
+
+
+async def api_get(client, url: str | None, params: dict[str, str]) -> dict[str, Any]:
+    """
+    Run a GET request to MediaWiki's APIs and return its JSON data.
+
+    Every request of the process goes through here, so that:
+    - at most API_MAX_IN_FLIGHT requests run at the same time
+    - at most API_RATE requests per second are sent (see `TokenBucket`)
+    - timeouts, network errors, 429 / 5xx responses and `maxlag` errors
+      are retried up to API_MAX_RETRIES times, waiting for the time set
+      by Retry-After or else an exponential backoff with jitter, as long
+      as the retry budget allows it (see `RetryBudget`)
+
+    Raise httpx.HTTPError once we give up.
+    """
+
+    params = {**params, "maxlag": API_MAXLAG}
+
+    attempt = 0
+    while True:
+        retry_after = None
+
+        await bucket.acquire()
+
+        try:
+            async with get_in_flight():
+                response = await client.get(url, params=params)
+
+            try:
+                data = response.json()
+
+            except ValueError:
+                data = {}
+
+            error_code = data.get("error", {}).get("code")
+
+            if (
+                response.status_code not in RETRY_STATUS_CODES
+                and error_code not in RETRY_ERROR_CODES
+            ):
+                response.raise_for_status()
+
+                bucket.speed_up()
+                retry_budget.deposit()
+                return data
+
+            retry_after = get_retry_after(response.headers.get("retry-after"))
+            message = f"MediaWiki error {response.status_code}"
+            if error_code is not None:
+                message += f" ({error_code})"
+
+            error = httpx.HTTPStatusError(
+                message,
+                request=response.request,
+                response=response,
+            )
+
+            if response.status_code == 429 or error_code in RETRY_ERROR_CODES:
+                bucket.slow_down()
+
+        except (
+            httpx.TimeoutException,
+            httpx.NetworkError,
+            httpx.RemoteProtocolError,
+        ) as exc:
+            error = exc
+
+        if attempt >= API_MAX_RETRIES or not retry_budget.withdraw():
+            await log("error", f"api-get: give up => {params} => {error}\n", sem=None)
+            raise error
+
+        delay = get_backoff(attempt)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+            bucket.pause(retry_after)
+
+        attempt += 1
+        print(f"api-get: retry {attempt} in {delay:.1f}s => {error}")
+        await asyncio.sleep(delay)
 
 
 async def query_continue(client, url: str | None, params: dict[str, str]):
@@ -58,101 +230,179 @@ async def query_continue(client, url: str | None, params: dict[str, str]):
         req = request.copy()
         req.update(last_continue)
 
-        try:
-            response = await client.get(url, params=req)
-            result = response.json()
-
-            if "warnings" in result:
-                print(result["warnings"])
-            if "query" in result:
-                yield result["query"]
-            if "continue" not in result:
-                # print('query-continue over, break!')
-                break
+        result = await api_get(client, url, req)
 
-            last_continue = result["continue"]
+        if "warnings" in result:
+            print(result["warnings"])
+        if "query" in result:
+            yield result["query"]
+        if "continue" not in result:
+            # print('query-continue over, break!')
+            break
 
-        except httpx.TimeoutException:
-            await log("error", f"query-continue e => {params}\n", sem=None)
+        last_continue = result["continue"]
 
 
-async def fetch_article(title: str, client):
+async def fetch_articles_metadata(
+    titles: list[str], client, raise_errors: bool = False
+) -> dict[str, dict[str, Any] | None]:
     """
-    Fetch an article by its title, running several requests
-    to get all the necessary bits of data.
+    Fetch last revision, categories and backlinks of the given titles,
+    by running one query every 50 titles (MediaWiki's limit for the
+    `titles` parameter). Return a dictionary keyed by the given titles.
+
+    MediaWiki normalizes titles and follows redirects, so we keep track
+    of which page each given title has been resolved to.
+
+    If a query fails, the titles of its chunk get None, as if
+    they were not found: only those articles are skipped.
+    Pass raise_errors to raise the httpx.HTTPError instead.
     """
 
-    print(f"fetching article {title}")
+    async def fetch_chunk(chunk: list[str]) -> dict[str, dict[str, Any] | None]:
+        params = {
+            "action": "query",
+            "titles": "|".join(chunk),
+            "prop": "revisions|categories|linkshere",
+            "rvprop": "ids|timestamp",
+            "cllimit": "max",
+            "lhprop": "pageid|title",
+            "lhlimit": "max",
+            "formatversion": "2",
+            "format": "json",
+            "redirects": "1",
+        }
+
+        resolved = {title: title for title in chunk}
+        pages = {}
 
-    is_styles_page = title == config['wiki']['stylespage']
+        try:
+            async for response in query_continue(client, URL, params):
+                for key in ["normalized", "redirects"]:
+                    for item in response.get(key, []):
+                        for title, target in resolved.items():
+                            if target == item["from"]:
+                                resolved[title] = item["to"]
 
-    # for HTML-parsed wiki article
-    parse_params = {
-        "action": "parse",
-        "prop": "text|langlinks|categories|templates|images|displaytitle",
-        "page": title,
-        "formatversion": "2",
-        "format": "json",
-        "redirects": "1",
-        "disableeditsection": "1",
-        "disablestylededuplication": "1",
-    }
+                # with query-continue the same page is returned
+                # in several responses, each one with the next batch
+                # of categories and backlinks: we merge them together
+                for page in response.get("pages", []):
+                    entry = pages.setdefault(
+                        page["title"], {**page, "categories": [], "linkshere": []}
+                    )
 
-    if is_styles_page:
-        parse_params["prop"] += "|wikitext"
+                    if "revisions" in page:
+                        entry["revisions"] = page["revisions"]
+
+                    entry["categories"].extend(page.get("categories", []))
+                    entry["linkshere"].extend(page.get("linkshere", []))
+
+        except httpx.HTTPError as exc:
+            # skip only the articles of this chunk
+            await log(
+                "error",
+                f"(fetch) articles-metadata err :: {len(chunk)} titles - {exc}\n",
+                sem=None,
+            )
+
+            if raise_errors:
+                raise
+
+            return {title: None for title in chunk}
+
+        return {title: pages.get(target) for title, target in resolved.items()}
+
+    chunk_tasks = []
+    for idx in range(0, len(titles), 50):
+        task = fetch_chunk(titles[idx : idx + 50])
+        chunk_tasks.append(asyncio.ensure_future(task))
+
+    metadata = {}
+    for chunk in await asyncio.gather(*chunk_tasks):
+        metadata.update(chunk)
 
-    # for wiki article's  oldest revisions and backlinks fields
-    query_params = {
+    return metadata
+
+
+async def fetch_creation_timestamp(title: str, client) -> str | None:
+    """
+    Fetch the timestamp of the first revision of the given title.
+
+    MediaWiki lets us set the order of the revisions list only when
+    querying a single page, therefore this can't be batched. As the
+    creation of an article does not change, we run this only for the
+    articles missing from the build manifest.
+    """
+
+    params = {
         "action": "query",
         "titles": title,
         "prop": "revisions",
         "rvdir": "newer",
+        "rvlimit": "1",
         "rvprop": "timestamp",
-        "bltitle": title,
-        "list": "backlinks",
         "formatversion": "2",
         "format": "json",
         "redirects": "1",
     }
 
-    # we might either want to fetch the whole list of revisions in several
-    # HTTP calls, (see for instance fetch_category()), or do two HTTP calls
-    # and fetch the first 5 + the last one in the list. we do this second
-    # option given MW's APIs are what they are...
-    rev_params = {
-        "action": "query",
-        "titles": title,
-        "prop": "revisions",
-        "rvdir": "older",
-        "rvprop": "timestamp",
+    data = await api_get(client, URL, params)
+
+    page = data["query"]["pages"][0]
+    if "revisions" in page:
+        return page["revisions"][0]["timestamp"]
+
+    return None
+
+
+async def fetch_article_parse(
+    title: str,
+    client,
+    page: dict[str, Any] | None,
+    creation: str | None,
+    raise_errors: bool = False,
+):
+    """
+    Fetch the parsed HTML of the given article and put it together
+    with its metadata (see `fetch_articles_metadata`).
+
+    If the requests fail, the article is returned as not found,
+    unless raise_errors is set: then the httpx.HTTPError is raised.
+    """
+
+    print(f"fetching article {title}")
+
+    is_styles_page = title == config["wiki"]["stylespage"]
+
+    # for HTML-parsed wiki article
+    parse_params = {
+        "action": "parse",
+        "prop": "text|langlinks|templates|images|displaytitle",
+        "page": title,
         "formatversion": "2",
         "format": "json",
         "redirects": "1",
+        "disableeditsection": "1",
+        "disablestylededuplication": "1",
     }
 
+    if is_styles_page:
+        parse_params["prop"] += "|wikitext"
+
     article = None
     backlinks = None
     redirect_target = None
 
-    try:
-        parse_response = await client.get(URL, params=parse_params)
-        parse_data = parse_response.json()
-        parse_response.raise_for_status()
-
-        query_response = await client.get(URL, params=query_params)
-        query_data = query_response.json()
-        query_response.raise_for_status()
-
-        rev_response = await client.get(URL, params=rev_params)
-        rev_data = rev_response.json()
-        rev_response.raise_for_status()
+    # -- ns: -1 is part of Special Pages, we don't parse those
+    if page is None or page["ns"] == -1 or "missing" in page:
+        return article, backlinks, redirect_target
 
-        query_data = query_data["query"]
-        rev_data = rev_data["query"]
+    try:
+        parse_data = await api_get(client, URL, parse_params)
 
-        # -- ns: -1 is part of Special Pages, we don't parse those
-        if query_data["pages"][0]["ns"] == -1:
-            return article, backlinks, redirect_target
+        if creation is None:
+            creation = await fetch_creation_timestamp(title, client)
 
         if "parse" in parse_data:
 
@@ -169,13 +419,19 @@ async def fetch_article(title: str, client):
 
             article = parse_data["parse"]
 
-            rev_beginning = query_data["pages"][0]["revisions"]
-            rev_end = rev_data["pages"][0]["revisions"]
+            rev_end = page["revisions"]
 
-            article["creation"] = rev_beginning[0]["timestamp"]
+            article["creation"] = creation
             article["last_modified"] = rev_end[0]["timestamp"]
 
-            backlinks = query_data["backlinks"]
+            # keep the same shape of the categories field
+            # returned by MW's parse API, eg `{"category": "Summer_Academy"}`
+            article["categories"] = [
+                {"category": cat["title"].split(":", 1)[-1].replace(" ", "_")}
+                for cat in page["categories"]
+            ]
+
+            backlinks = page["linkshere"]
 
             for link in backlinks:
                 link["slug"] = slugify(link["title"])
@@ -196,9 +452,60 @@ async def fetch_article(title: str, client):
             sem=None,
         )
 
+        if raise_errors:
+            raise
+
         return article, backlinks, redirect_target
 
 
+async def fetch_articles(
+    titles: list[str], client, raise_errors: bool = False
+) -> dict[str, tuple]:
+    """
+    Fetch several articles at once by their titles: we batch the
+    metadata of every article in as few requests as possible, and run
+    only the parse request for each article on its own.
+
+    Return a dictionary keyed by title, each value being the same
+    tuple returned by `fetch_article`.
+
+    An article whose requests fail is returned as not found, unless
+    raise_errors is set (see `fetch_article_parse`).
+    """
+
+    # avoid circular import, build_manifest reads settings
+    # and the database only
+    from app.build_manifest import get_creation_timestamps
+
+    metadata = await fetch_articles_metadata(titles, client, raise_errors)
+    creations = get_creation_timestamps(titles)
+
+    parse_tasks = []
+    for title in titles:
+        task = fetch_article_parse(
+            title, client, metadata.get(title), creations.get(title), raise_errors
+        )
+        parse_tasks.append(asyncio.ensure_future(task))
+
+    results = await asyncio.gather(*parse_tasks)
+
+    return dict(zip(titles, results))
+
+
+async def fetch_article(title: str, client, raise_errors: bool = False):
+    """
+    Fetch an article by its title, running several requests
+    to get all the necessary bits of data.
+
+    Pass raise_errors to tell a failed fetch (httpx.HTTPError raised)
+    apart from an article not found (None returned).
+    """
+
+    articles = await fetch_articles([title], client, raise_errors)
+
+    return articles[title]
+
+
 async def fetch_category(cat: str, client) -> list[dict[str, bool | dict[str, int]]]:
     """
     Fetch all the articles from the given cat.
@@ -232,38 +539,98 @@ async def fetch_category(cat: str, client) -> list[dict[str, bool | dict[str, in
     return data
 
 
-async def query_wiki(
-    ENV: str | None, URL: str | None, query: str
-) -> list[dict[Any, Any]] | bool:
+async def fetch_category_revisions(cat: str, client) -> dict[str, dict[str, Any]]:
     """
-    Run a search query to MediaWiki and return its results.
+    Fetch only the revision metadata (pageid, lastrevid, touched)
+    of every article in the given cat, keyed by title.
     """
 
-    print(f"Querying mediawiki for { query } ...")
+    print(f"fetching category revisions {cat}")
 
     params = {
         "action": "query",
-        "list": "search",
-        "srsearch": query,
+        "generator": "categorymembers",
+        "gcmtitle": f"Category:{cat}",
+        "gcmlimit": "50",
+        "prop": "info",
         "formatversion": "2",
         "format": "json",
         "redirects": "1",
     }
 
-    context = create_context(ENV)
-    timeout = httpx.Timeout(10.0, connect=60.0)
-    results = []
-    async with httpx.AsyncClient(verify=context, timeout=timeout) as client:
-        async for response in query_continue(client, URL, params):
-            response = response["search"]
-            if len(response) > 0 and "missing" in response[0]:
-                title = response[0]["title"]
-                print(f"the page could not be found => {title}")
-                return False
+    pages = {}
+    async for response in query_continue(client, URL, params):
+        for page in response["pages"]:
+            if "missing" in page:
+                print(f"the page could not be found => {page['title']}")
+
             else:
-                results.extend(response)
+                pages[page["title"]] = page
+
+    return pages
+
+
+async def fetch_missing_titles(titles: list[str], client) -> list[str]:
+    """
+    Return the given titles that do not exist (anymore) on the wiki,
+    by running one query every 50 titles.
+
+    If a query fails, its titles are not returned: we'd rather keep
+    an article that is gone than delete one that still exists.
+    """
+
+    missing = []
+
+    for idx in range(0, len(titles), 50):
+        params = {
+            "action": "query",
+            "titles": "|".join(titles[idx : idx + 50]),
+            "formatversion": "2",
+            "format": "json",
+        }
+
+        try:
+            data = await api_get(client, URL, params)
+
+        except httpx.HTTPError as exc:
+            await log("error", f"(fetch) missing-titles err => {exc}\n", sem=None)
+            continue
+
+        query = data.get("query", {})
+
+        # map MediaWiki's normalized titles back to the given ones
+        normalized = {item["to"]: item["from"] for item in query.get("normalized", [])}
+
+        for page in query.get("pages", []):
+            if "missing" in page:
+                missing.append(normalized.get(page["title"], page["title"]))
+
+    return missing
+
+
+async def fetch_recent_changes(start: str, client) -> list[dict[str, Any]]:
+    """
+    Fetch every recent change (edits, new pages, log entries)
+    from the given timestamp onwards, oldest first.
+    """
+
+    params = {
+        "action": "query",
+        "list": "recentchanges",
+        "rcstart": start,
+        "rcdir": "newer",
+        "rcprop": "title|ids|timestamp|loginfo",
+        "rctype": "edit|new|log",
+        "rclimit": "500",
+        "formatversion": "2",
+        "format": "json",
+    }
+
+    changes = []
+    async for response in query_continue(client, URL, params):
+        changes.extend(response["recentchanges"])
 
-    return results
+    return changes
 
 
 def convert_article_trans_title_to_regular_title(title: str) -> str:
@@ -1,74 +1,295 @@
 import asyncio
+import gzip
+import hashlib
 import os
-import subprocess
-import sys
+import uuid
 from pathlib import Path
 
 import aiofiles
 from dotenv import load_dotenv
 
+try:
+    import brotli
+
+except ImportError:
+    brotli = None
+
 load_dotenv()
 
 
 WIKI_DIR = os.getenv("WIKI_DIR")
 
+# file extensions of the static assets worth compressing
+# (eg woff2 fonts and images are compressed already)
+COMPRESS_SUFFIXES = [".html", ".css", ".js", ".svg", ".otf", ".xml", ".webmanifest"]
 
-def file_lookup(filename: str) -> list[Path]:
+# suffixes of the compressed versions we write next to each file
+ENCODING_SUFFIXES = [".gz", ".br"] if brotli is not None else [".gz"]
+
+# set of the slugs of every HTML file in WIKI_DIR, built on
+# first lookup and kept up-to-date by write_to_disk and
+# remove_from_file_index (and by watch_file_index, if running)
+file_index: set[str] | None = None
+
+# number of files written by write_to_disk since the last
+# reset_write_stats, by whether their content changed or not
+write_stats = {"changed": 0, "unchanged": 0}
+
+
+def build_file_index() -> set[str]:
     """
-    Recursively check if given filename is found
-    in WIKI_DIR and return list of results.
+    Scan WIKI_DIR once and (re-)build the file index.
     """
 
-    # TODO look how to make this pattern work
-    # so we can match also partial URI
-    # pattern = f"*{filename}*.html"
+    global file_index
+
+    file_index = {p.stem for p in Path(WIKI_DIR).glob("*.html")}
+
+    return file_index
+
 
-    pattern = f"{filename}.html"
-    paths = [p for p in Path(WIKI_DIR).glob(pattern)]
+def get_file_index() -> set[str]:
+    """
+    Return the file index, building it on first lookup.
+    """
 
-    return paths
+    return file_index if file_index is not None else build_file_index()
 
 
-def search_file_content(pattern: str) -> list[str]:
+def set_file_index(index: set[str]) -> None:
     """
-    Run a ripgrep search with the given pattern
-    inside WIKI_DIR and return a list of filepaths.
+    Replace the file index with the given one, eg the one
+    of the main process in a worker process.
+    """
+
+    global file_index
+
+    file_index = index
+
+
+def remove_from_file_index(filename: str) -> None:
+    """
+    Remove given filename from the file index.
+    """
+
+    if file_index is not None:
+        file_index.discard(filename)
+
+
+async def watch_file_index(stop_event: asyncio.Event) -> None:
+    """
+    Keep the file index up-to-date with the changes made to WIKI_DIR
+    by other processes (eg the UDP server or a CLI build command),
+    using inotify through the watchfiles package, if installed.
+
+    Set stop_event to stop watching.
     """
 
     try:
-        RG_PATH = subprocess.check_output(
-            ["/usr/bin/which", "rg"], text=True, cwd=WIKI_DIR
-        ).strip()
-
-    except subprocess.CalledProcessError:
-        # no ripgrep (rg) found in the system.
-        # stop everything and exit. print a user-facing
-        # message asking to install ripgrep.
-        print(
-            "search_file_content error =>  ripgrep is not installed\n",
-            "in the system. please install it, see README.md",
+        from watchfiles import Change, awatch
+
+    except ImportError:
+        print("file-index => watchfiles is not installed, not watching WIKI_DIR")
+        return
+
+    if file_index is None:
+        build_file_index()
+
+    async for changes in awatch(WIKI_DIR, recursive=False, stop_event=stop_event):
+        for change, path in changes:
+            path = Path(path)
+            if path.suffix != ".html":
+                continue
+
+            if change == Change.deleted:
+                file_index.discard(path.stem)
+            else:
+                file_index.add(path.stem)
+
+
+def compress(data: bytes, best: bool = False) -> dict[str, bytes]:
+    """
+    Return the gzip (and brotli, if installed) compressed
+    versions of the given data, keyed by file suffix.
+
+    Pages are compressed on every write (in a thread, see
+    `write_compressed`): by default we use mid-range levels, which
+    are many times faster than the highest ones for a few percent
+    larger files. Pass best=True for the static assets, compressed once.
+    """
+
+    gzip_level, brotli_quality = (9, 11) if best else (6, 5)
+
+    compressed = {".gz": gzip.compress(data, compresslevel=gzip_level, mtime=0)}
+
+    if brotli is not None:
+        compressed[".br"] = brotli.compress(
+            data, mode=brotli.MODE_TEXT, quality=brotli_quality
         )
-        sys.exit(1)
 
-    print(f"RG_PATH => {RG_PATH}")
+    return compressed
+
+
+def make_temp_path(file_path: str | Path) -> str:
+    """
+    Return the path of the temporary file to write before
+    replacing file_path with it. The file lives in the same
+    folder, so that os.replace is an atomic rename.
+
+    The name is unique to each write, so that concurrent writes
+    of the same file (eg a build and a backlink update) never
+    share a temporary file: the last one to be renamed wins.
+    """
+
+    file_path = Path(file_path)
+
+    return str(file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.tmp"))
+
+
+async def write_atomic(file_path: str | Path, data: bytes) -> None:
+    """
+    Write the given data to a temporary file, then replace file_path
+    with it, so that readers (eg `main.py`) see either the old or the
+    new version of the file, never a partly written one.
+    """
+
+    temp_path = make_temp_path(file_path)
 
     try:
-        # we're `cd`-ing into WIKI_DIR by passing the option
-        # `cwd=WIKI_DIR, so we don't pass to `rg` a base-dir path
-        # at it's assumed to default to CWD
-        matches = subprocess.check_output(
-            [RG_PATH, "--type", "html", "--files-with-matches", pattern],
-            text=True,
-            cwd=WIKI_DIR,
-        )
+        async with aiofiles.open(temp_path, mode="wb") as f:
+            await f.write(data)
+
+        os.replace(temp_path, file_path)
+
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+def write_atomic_sync(file_path: str | Path, data: bytes) -> None:
+    """
+    Same as `write_atomic`, for code not running in the event loop.
+    """
+
+    temp_path = make_temp_path(file_path)
+
+    try:
+        Path(temp_path).write_bytes(data)
+        os.replace(temp_path, file_path)
 
-        results = matches.splitlines()
-        return results
-    except subprocess.CalledProcessError:
-        # no rg match. return empty list.
-        print(f"search-file-content => no match for {pattern}")
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
 
-        return []
+
+def hash_file(file_path: str | Path) -> str | None:
+    """
+    Return the sha256 hash of the content of file_path,
+    or None if the file does not exist.
+    """
+
+    try:
+        return hashlib.sha256(Path(file_path).read_bytes()).hexdigest()
+
+    except FileNotFoundError:
+        return None
+
+
+def has_content(file_path: str | Path, data: bytes) -> bool:
+    """
+    Check if file_path exists and has the given data as content.
+    """
+
+    return hash_file(file_path) == hashlib.sha256(data).hexdigest()
+
+
+def reset_write_stats() -> None:
+    """
+    Reset the counters of the files written by write_to_disk.
+    """
+
+    write_stats["changed"] = 0
+    write_stats["unchanged"] = 0
+
+
+async def write_compressed(file_path: str, data: bytes) -> None:
+    """
+    Write the compressed versions of the given data next to file_path
+    (eg `<slug>.html.gz` and `<slug>.html.br`), so they can be served
+    as they are to clients accepting those encodings.
+
+    Siblings are written after the file itself: a sibling older than
+    its file is out of date and is not served.
+
+    Compressing is CPU-bound: we run it in a thread, so the event
+    loop (eg the UDP server) keeps running in the meantime.
+    """
+
+    siblings = await asyncio.to_thread(compress, data)
+
+    for suffix, compressed in siblings.items():
+        await write_atomic(f"{file_path}{suffix}", compressed)
+
+
+def remove_compressed(file_path: str | Path) -> None:
+    """
+    Remove the compressed versions of file_path, if any.
+    """
+
+    for suffix in [".gz", ".br"]:
+        Path(f"{file_path}{suffix}").unlink(missing_ok=True)
+
+
+def is_compressed(file_path: Path) -> bool:
+    """
+    Check if every compressed version of file_path exists
+    and is not older than file_path.
+    """
+
+    mtime = file_path.stat().st_mtime_ns
+
+    for suffix in ENCODING_SUFFIXES:
+        sibling = Path(f"{file_path}{suffix}")
+        if not sibling.exists() or sibling.stat().st_mtime_ns < mtime:
+            return False
+
+    return True
+
+
+def compress_assets(assets_path: Path) -> None:
+    """
+    Write the compressed versions of every static asset in assets_path
+    worth compressing, skipping the ones compressed already.
+    """
+
+    for file_path in assets_path.rglob("*"):
+        if file_path.suffix not in COMPRESS_SUFFIXES or not file_path.is_file():
+            continue
+
+        if not is_compressed(file_path):
+            data = file_path.read_bytes()
+
+            for suffix, compressed in compress(data, best=True).items():
+                write_atomic_sync(f"{file_path}{suffix}", compressed)
+
+
+def file_lookup(filename: str) -> list[Path]:
+    """
+    Check if given filename is found in WIKI_DIR
+    and return list of results.
+
+    We look up the file index instead of scanning
+    WIKI_DIR each time.
+    """
+
+    # TODO look how to make this pattern work
+    # so we can match also partial URI
+    # pattern = f"*{filename}*.html"
+
+    if filename in get_file_index():
+        return [Path(WIKI_DIR) / f"{filename}.html"]
+
+    return []
 
 
 async def write_to_disk(
@@ -76,28 +297,70 @@ async def write_to_disk(
     document: str,
     sem: asyncio.Semaphore | None = None,
     is_styles_page: bool = False,
-):
+) -> bool:
     """
     Write given file to disk. We wrap the actual function in an
     extra function that checks whether the sem parameter is used,
     so as to iterate with it accordingly.
+
+    If the file on disk has the same content already, we leave it
+    (and its mtime) untouched; otherwise we write it atomically,
+    see `write_atomic`.
+
+    Return True if the file has changed.
     """
 
-    async def write(page_slug: str | None, document: str):
-        if page_slug is not None:
-            file_path = f"./{WIKI_DIR}/{page_slug}.html"
-            if is_styles_page:
-                file_path = f"./{WIKI_DIR}/assets/styles/{page_slug}.css"
-            async with aiofiles.open(file_path, mode="w") as f:
-                try:
-                    await f.write(document)
-                    print(f"✓ {page_slug} has been correctly written to disk")
-                except Exception as e:
-                    print(f"✕ error for {page_slug} => {e}")
+    async def write_compressed_safe(
+        page_slug: str, file_path: str, data: bytes
+    ) -> None:
+        # the file itself is written already: a failure here only
+        # means its compressed versions are out of date, and are
+        # not served (see `is_compressed`)
+        try:
+            await write_compressed(file_path, data)
+        except Exception as e:
+            print(f"✕ compress error for {page_slug} => {e}")
+
+    async def write(page_slug: str | None, document: str) -> bool:
+        if page_slug is None:
+            return False
+
+        file_path = f"./{WIKI_DIR}/{page_slug}.html"
+        if is_styles_page:
+            file_path = f"./{WIKI_DIR}/assets/styles/{page_slug}.css"
+
+        data = document.encode()
+
+        # hashing reads the whole file: run it in a thread,
+        # as compressing it (see `write_compressed`)
+        if await asyncio.to_thread(has_content, file_path, data):
+            write_stats["unchanged"] += 1
+
+            # eg a previous build got interrupted after writing the file
+            if not is_compressed(Path(file_path)):
+                await write_compressed_safe(page_slug, file_path, data)
+
+            return False
+
+        try:
+            await write_atomic(file_path, data)
+            print(f"✓ {page_slug} has been correctly written to disk")
+        except Exception as e:
+            print(f"✕ error for {page_slug} => {e}")
+            return False
+
+        write_stats["changed"] += 1
+
+        if not is_styles_page and file_index is not None:
+            file_index.add(page_slug)
+
+        await write_compressed_safe(page_slug, file_path, data)
+
+        return True
 
     if sem is not None:
         async with sem:
-            await write(page_slug, document)
+            return await write(page_slug, document)
 
     else:
-        await write(page_slug, document)
+        return await write(page_slug, document)
@@ -0,0 +1,116 @@
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from app.db import get_db
+
+load_dotenv()
+
+
+# number of times we try to process a message before giving up on it
+JOURNAL_MAX_FAILURES = int(os.getenv("JOURNAL_MAX_FAILURES", "3"))
+
+# number of days we keep processed messages in the journal
+JOURNAL_RETENTION = float(os.getenv("JOURNAL_RETENTION", "7"))
+
+
+def append_to_journal(msg: dict, article_title: str) -> int | None:
+    """
+    Append the given message (and the article title it points to)
+    to the journal, and return its id.
+
+    The message is committed to disk before being processed,
+    so it survives a crash or a restart of the server.
+
+    Messages are unique by their recent change id (`id` in the UDP
+    message, `rcid` in the APIs): return None if the journal has the
+    message already, eg when it has been received both through UDP
+    and through `reconcile.py`.
+    """
+
+    db = get_db()
+    cursor = db.execute(
+        "INSERT OR IGNORE INTO journal (received, rcid, title, msg)"
+        " VALUES (?, ?, ?, ?)",
+        (time.time(), msg.get("id"), article_title, json.dumps(msg)),
+    )
+    db.commit()
+
+    if cursor.rowcount == 0:
+        return None
+
+    return cursor.lastrowid
+
+
+def mark_processed(ids: list[int]) -> None:
+    """
+    Mark the given journal messages as processed.
+    """
+
+    db = get_db()
+    db.executemany(
+        "UPDATE journal SET processed = 1 WHERE id = ?",
+        [(journal_id,) for journal_id in ids],
+    )
+    db.commit()
+
+
+def mark_failed(ids: list[int]) -> None:
+    """
+    Count one more failure for the given journal messages: they are
+    replayed on the next start of the server, until they have failed
+    JOURNAL_MAX_FAILURES times.
+    """
+
+    db = get_db()
+    db.executemany(
+        "UPDATE journal SET failures = failures + 1 WHERE id = ?",
+        [(journal_id,) for journal_id in ids],
+    )
+    db.commit()
+
+
+def get_unprocessed() -> list[dict]:
+    """
+    Return the messages of the journal not processed yet,
+    in the order they have been received.
+    """
+
+    db = get_db()
+
+    given_up = db.execute(
+        "SELECT count(*) FROM journal WHERE processed = 0 AND failures >= ?",
+        (JOURNAL_MAX_FAILURES,),
+    ).fetchone()[0]
+
+    if given_up > 0:
+        print(
+            f"journal => skipping {given_up} messages "
+            f"failed {JOURNAL_MAX_FAILURES} times already"
+        )
+
+    rows = db.execute(
+        "SELECT id, title, msg FROM journal"
+        " WHERE processed = 0 AND failures < ? ORDER BY id",
+        (JOURNAL_MAX_FAILURES,),
+    ).fetchall()
+
+    return [
+        {"id": row["id"], "title": row["title"], "msg": json.loads(row["msg"])}
+        for row in rows
+    ]
+
+
+def prune_journal() -> None:
+    """
+    Remove the processed messages older than JOURNAL_RETENTION days.
+    """
+
+    db = get_db()
+    db.execute(
+        "DELETE FROM journal WHERE processed = 1 AND received < ?",
+        (time.time() - JOURNAL_RETENTION * 24 * 60 * 60,),
+    )
+    db.commit()
@@ -0,0 +1,83 @@
+from app.db import get_db
+
+
+def update_links(source: str, links: list[dict[str, str]]) -> None:
+    """
+    Replace the outgoing links of the given source slug with
+    the given list of links (each one with a title and a slug),
+    as extracted by `parser.post_process`.
+    """
+
+    db = get_db()
+    db.execute("DELETE FROM links WHERE source = ?", (source,))
+    db.executemany(
+        "INSERT OR IGNORE INTO links (source, target, target_title) VALUES (?, ?, ?)",
+        [(source, link["slug"], link["title"]) for link in links],
+    )
+    db.commit()
+
+
+def remove_links(source: str) -> None:
+    """
+    Remove every outgoing link of the given source slug.
+    """
+
+    db = get_db()
+    db.execute("DELETE FROM links WHERE source = ?", (source,))
+    db.commit()
+
+
+def get_outgoing_links(source: str) -> list[dict[str, str]]:
+    """
+    Return the list of links (title and slug) the given source slug points to.
+    """
+
+    db = get_db()
+    rows = db.execute(
+        "SELECT target, target_title FROM links WHERE source = ?", (source,)
+    ).fetchall()
+
+    return [{"title": row["target_title"], "slug": row["target"]} for row in rows]
+
+
+def diff_links(
+    source: str, links: list[dict[str, str]]
+) -> dict[str, list[dict[str, str]]]:
+    """
+    Compare the outgoing links stored for the given source slug
+    with the given new list of links, and return the added, removed
+    and kept ones (each one with a title and a slug).
+    """
+
+    old = {link["slug"]: link for link in get_outgoing_links(source)}
+    new = {link["slug"]: link for link in links}
+
+    return {
+        "added": [link for slug, link in new.items() if slug not in old],
+        "removed": [link for slug, link in old.items() if slug not in new],
+        "kept": [link for slug, link in new.items() if slug in old],
+    }
+
+
+def get_incoming_links(target: str) -> list[str]:
+    """
+    Return the list of slugs pointing to the given target slug.
+    """
+
+    db = get_db()
+    rows = db.execute("SELECT source FROM links WHERE target = ?", (target,)).fetchall()
+
+    return [row["source"] for row in rows]
+
+
+def get_linked_pages(slug: str) -> list[str]:
+    """
+    Return the slugs of every page either linking to the given slug,
+    or being linked by it (and therefore listing it in its
+    "What links here" block).
+    """
+
+    outgoing = [link["slug"] for link in get_outgoing_links(slug)]
+    incoming = get_incoming_links(slug)
+
+    return list(dict.fromkeys([*incoming, *outgoing]))
@@ -1,24 +1,30 @@
+import asyncio
 import os
 from pathlib import Path
 
-import aiofiles
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
 from slugify import slugify
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from app.fetch import query_wiki
-from app.file_ops import file_lookup
+from app.page_cache import (
+    PrecompressedStaticFiles,
+    accepted_encodings,
+    get_page,
+    is_not_modified,
+    page_headers,
+)
 from app.read_settings import main as read_settings
+from app.redirect_map import get_redirect, load_redirect_map, watch_redirect_map
+from app.search_index import search_articles
 
 from .views.template_utils import (
-    make_timestamp,
-    make_timestamp_friendly,
-    make_url_slug,
-    paginator,
+    TEMPLATES_DIR,
+    get_environment,
+    paginator_from_count,
+    precompile_templates,
 )
 from .views.views import make_error_page, make_search_index
 
@@ -29,10 +35,10 @@ app = FastAPI(docs_url=None, redoc_url=None)
 
 base_dir = Path.cwd()
 
-templates = Jinja2Templates(directory=Path(__file__).parent / "views" / "templates")
-templates.env.filters["slug"] = make_url_slug
-templates.env.filters["ts"] = make_timestamp
-templates.env.filters["tsh"] = make_timestamp_friendly
+# share the same Jinja environment (filters, compiled templates)
+# used by the build functions
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates.env = get_environment()
 
 
 config = read_settings()
@@ -43,13 +49,38 @@ WIKI_PATH = os.getenv( "WIKI_DIR" )
 WIKI_DIR = Path( WIKI_PATH ).resolve()
 ASSETS_PATH = os.getenv( "ASSETS_DIR" )
 ASSETS_DIR = WIKI_DIR / ASSETS_PATH
+SEARCH_PAGE_SIZE = 5
 
 print ( ASSETS_DIR )
 
 if not Path( WIKI_DIR ).exists():
     raise ValueError(f"WIKI_DIR does not yet exist. Please run the CLI setup command to create it")
 
-app.mount( "/assets", StaticFiles(directory=ASSETS_DIR), name="assets" )
+app.mount( "/assets", PrecompressedStaticFiles(directory=ASSETS_DIR), name="assets" )
+
+
+@app.on_event("startup")
+async def startup():
+    """
+    Load the redirect map once, and keep it up-to-date while the app runs.
+    Compile the templates ahead of the first request.
+    """
+
+    precompile_templates()
+    load_redirect_map()
+
+    app.state.stop_watch = asyncio.Event()
+    app.state.watch = asyncio.ensure_future(watch_redirect_map(app.state.stop_watch))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    Stop watching the redirect map.
+    """
+
+    app.state.stop_watch.set()
+    await app.state.watch
 
 
 @app.exception_handler(StarletteHTTPException)
@@ -85,24 +116,16 @@ async def root(request: Request):
     Read from WIKI_DIR and return index.html.
     """
 
-    try:
-        file_path = f"{WIKI_DIR}/index.html"
-
-        async with aiofiles.open(file_path, mode="r") as f:
-            return await f.read()
-
-    except FileNotFoundError:
-        print("return 404")
-
-        raise HTTPException(status_code=404)
+    return await page_response(request, "index")
 
 
 @app.middleware("http")
 async def redirect_uri(request: Request, call_next):
     """
     Check if incoming URI is formatted in the previous
-    hd-www-v1 style (eg had-py) — below for examples.
-    Rewrite URI to match a possible wiki article on disk.
+    hd-www-v1 style (eg had-py), or points to a moved
+    article, and redirect it to the matching article,
+    using the redirect map (see `app/redirect_map.py`).
     """
 
     uri = request.url.path[1:]
@@ -111,51 +134,13 @@ async def redirect_uri(request: Request, call_next):
     ASSETS_DIR = os.getenv("ASSETS_DIR")
     if not uri.startswith(ASSETS_DIR):
 
-        # -- examples of old-style URIs:
-        # p/About
-        # s/Collaborators
-        # special case:
-        # - s/Summer_Camp_2023 => activities?type=hdsc2023
-        # - s/Summer_Camp_2023/p/Open_Call!_H%26D_Summer_Camp_2023_-_HopePunk%3A_Reknitting_Collective_Infrastructures
-        # - s/Summer_Camp_2023/p/Coding_in_Situ
+        redirect = get_redirect(uri)
+        if redirect is not None:
+            redirect_uri, status_code = redirect
 
-        tokens = uri.split("/")
+            print(f"uri-redirect => {uri}\n", f"r => {redirect_uri}")
 
-        if len(tokens) > 1:
-            new_uri = slugify(tokens[-1])
-            matches = file_lookup(new_uri)
-            if len(matches) > 0:
-                redirect_uri = Path(matches[0]).stem
-
-                print(
-                    f"uri-redirect => {uri}\n",
-                    f"=> {new_uri}\n",
-                    f"matches => {matches}\n" f"r => {redirect_uri}",
-                )
-
-                return RedirectResponse(url=f"/{redirect_uri}", status_code=301)
-
-            elif new_uri.startswith("summer-academy") or new_uri.startswith(
-                "summer-camp"
-            ):
-
-                summer_tokens = new_uri.split("-")
-                summer_type = summer_tokens[-2][0].lower()
-                summer_year = summer_tokens[-1]
-                event_label = slugify(config["wiki"]["categories"]["Event"]["label"])
-
-                redirect_uri = f"{event_label}?type=hds{summer_type}{summer_year}"
-
-                print(
-                    f"uri-redirect => {uri}\n",
-                    f"=> {new_uri}\n",
-                    f"r => {redirect_uri}",
-                )
-
-                return RedirectResponse(url=f"/{redirect_uri}", status_code=308)
-
-            else:
-                return RedirectResponse(url=f"/{new_uri}", status_code=301)
+            return RedirectResponse(url=f"/{redirect_uri}", status_code=status_code)
 
     # --
     response = await call_next(request)
@@ -165,16 +150,17 @@ async def redirect_uri(request: Request, call_next):
 @app.get("/search", response_class=HTMLResponse)
 async def search(request: Request, query: str, page: int | None = 0):
     """
-    Run a search query on MediaWiki's APIs and display
-    results back.
+    Run a search query on the local full-text search index
+    (see `app/search_index.py`) and display results back.
     """
 
     # check if exact slug is matches rendered HTML page and redirect to it
 
-    results = await query_wiki(ENV, URL, query)
+    page = max(page or 0, 0)
+    total, results = search_articles(query, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
 
     # -- make pagination
-    pagination = paginator(results, 5, page)
+    pagination = paginator_from_count(results, total, SEARCH_PAGE_SIZE, page)
 
     article = await make_search_index(pagination["data"], query)
 
@@ -190,14 +176,31 @@ async def article(request: Request, article: str):
     Read from WIKI_DIR and return matching HTML article.
     """
 
-    try:
-        filename = Path(article).stem
-        file_path = f"{WIKI_DIR}/{slugify(filename)}.html"
+    filename = Path(article).stem
+
+    return await page_response(request, slugify(filename))
 
-        async with aiofiles.open(file_path, mode="r") as f:
-            return await f.read()
+
+async def page_response(request: Request, slug: str) -> Response:
+    """
+    Return the HTML page of the given slug from the page cache
+    (see `app/page_cache.py`), precompressed if the client accepts it,
+    or a 304 response if the client's copy is still valid.
+    """
+
+    encodings = accepted_encodings(request.headers.get("accept-encoding"))
+
+    try:
+        page = await get_page(slug, encodings)
 
     except FileNotFoundError:
         print("return 404")
 
         raise HTTPException(status_code=404)
+
+    headers = page_headers(page)
+
+    if is_not_modified(request.headers, page):
+        return Response(status_code=304, headers=headers)
+
+    return HTMLResponse(content=page["body"], headers=headers)
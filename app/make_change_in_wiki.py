@@ -2,10 +2,9 @@ import asyncio
 import os
 import sys
 
-import httpx
 from dotenv import load_dotenv
 
-from app.fetch import create_context
+from app.fetch import close_client, get_client
 
 load_dotenv()
 
@@ -118,14 +117,15 @@ async def main(ENV: str | None, URL: str | None, input_page: str, operation: str
     this lets server.py do the rest.
     """
 
-    context = create_context(ENV)
-    async with httpx.AsyncClient(verify=context) as client:
+    client = get_client()
 
-        if operation == "edit":
-            await create_edit_page(URL, input_page, client)
+    if operation == "edit":
+        await create_edit_page(URL, input_page, client)
 
-        elif operation == "delete":
-            await delete_page(URL, input_page, client)
+    elif operation == "delete":
+        await delete_page(URL, input_page, client)
+
+    await close_client()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,244 @@
+import hashlib
+import os
+from collections import OrderedDict
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from typing import Any
+
+import aiofiles
+from dotenv import load_dotenv
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+
+load_dotenv()
+
+
+WIKI_DIR = os.getenv("WIKI_DIR")
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", str(64 * 1024 * 1024)))
+
+# content codings we write precompressed versions for, by order of
+# preference, and the suffix of their file (eg `<slug>.html.br`)
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# least recently used pages are at the start, most recently used at the end
+page_cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+page_cache_bytes = 0
+
+
+def remove_page(file_path: str) -> None:
+    """
+    Remove the given file from the page cache, if it's in it.
+    """
+
+    global page_cache_bytes
+
+    page = page_cache.pop(file_path, None)
+    if page is not None:
+        page_cache_bytes -= len(page["body"])
+
+
+def add_page(file_path: str, page: dict[str, Any]) -> None:
+    """
+    Add the given page to the page cache, then remove the least
+    recently used pages until the cache fits in PAGE_CACHE_SIZE bytes.
+    """
+
+    global page_cache_bytes
+
+    remove_page(file_path)
+
+    if len(page["body"]) > PAGE_CACHE_SIZE:
+        return
+
+    page_cache[file_path] = page
+    page_cache_bytes += len(page["body"])
+
+    while page_cache_bytes > PAGE_CACHE_SIZE:
+        _, old_page = page_cache.popitem(last=False)
+        page_cache_bytes -= len(old_page["body"])
+
+
+def accepted_encodings(accept_encoding: str | None) -> list[str]:
+    """
+    Return the content codings of the given Accept-Encoding header
+    we have precompressed versions for, by order of preference.
+    """
+
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        qvalue = 1.0
+        if params.strip().startswith("q="):
+            try:
+                qvalue = float(params.strip()[2:])
+
+            except ValueError:
+                qvalue = 0.0
+
+        accepted[coding.strip().lower()] = qvalue
+
+    return [
+        coding
+        for coding in ENCODING_SUFFIXES
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0
+    ]
+
+
+async def get_page(slug: str, encodings: list[str] | None = None) -> dict[str, Any]:
+    """
+    Return the HTML page of the given slug in WIKI_DIR with its
+    ETag and Last-Modified values, from the page cache if the file
+    has not changed since (same mtime and size), else from disk.
+
+    If encodings is set (see `accepted_encodings`), return the first
+    precompressed version of the page (see `file_ops.write_compressed`)
+    that is up-to-date with it, if any.
+
+    Raise FileNotFoundError if the file does not exist.
+    """
+
+    html_path = f"{WIKI_DIR}/{slug}.html"
+    html_stat = os.stat(html_path)
+
+    file_path = html_path
+    stat = html_stat
+    encoding = None
+
+    for coding in encodings or []:
+        try:
+            coding_path = f"{html_path}{ENCODING_SUFFIXES[coding]}"
+            coding_stat = os.stat(coding_path)
+
+        except FileNotFoundError:
+            continue
+
+        if coding_stat.st_mtime_ns >= html_stat.st_mtime_ns:
+            file_path = coding_path
+            stat = coding_stat
+            encoding = coding
+            break
+
+    page = page_cache.get(file_path)
+    if (
+        page is not None
+        and page["mtime"] == stat.st_mtime_ns
+        and page["size"] == stat.st_size
+    ):
+        page_cache.move_to_end(file_path)
+        return page
+
+    async with aiofiles.open(file_path, mode="rb") as f:
+        body = await f.read()
+
+    page = {
+        "body": body,
+        "encoding": encoding,
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "etag": f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+        "last_modified": formatdate(html_stat.st_mtime, usegmt=True),
+    }
+
+    # the file might have been written again while reading it:
+    # only cache it if it still has the same size we read
+    if len(body) == stat.st_size:
+        add_page(file_path, page)
+
+    return page
+
+
+def is_not_modified(headers, page: dict[str, Any]) -> bool:
+    """
+    Check the conditional headers of the request against the given
+    page, and return True if the client's copy is still valid.
+
+    If-None-Match takes precedence over If-Modified-Since, see
+    <https://httpwg.org/specs/rfc9110.html#rfc.section.13.2.2>.
+    """
+
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [etag.strip().removeprefix("W/") for etag in if_none_match.split(",")]
+        return "*" in etags or page["etag"] in etags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+
+        except (TypeError, ValueError):
+            return False
+
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
+        last_modified = parsedate_to_datetime(page["last_modified"])
+        return last_modified <= since
+
+    return False
+
+
+def page_headers(page: dict[str, Any]) -> dict[str, str]:
+    """
+    Return the validator and encoding headers of the given page.
+    """
+
+    headers = {
+        "ETag": page["etag"],
+        "Last-Modified": page["last_modified"],
+        "Vary": "Accept-Encoding",
+    }
+
+    if page["encoding"] is not None:
+        headers["Content-Encoding"] = page["encoding"]
+
+    return headers
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles serving the precompressed version of an asset
+    (see `file_ops.compress_assets`) to clients accepting it,
+    if it is up-to-date with the asset.
+    """
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        encodings = accepted_encodings(request_headers.get("accept-encoding"))
+
+        for coding in encodings:
+            try:
+                coding_path = f"{full_path}{ENCODING_SUFFIXES[coding]}"
+                coding_stat = os.stat(coding_path)
+
+            except FileNotFoundError:
+                continue
+
+            if coding_stat.st_mtime_ns >= stat_result.st_mtime_ns:
+                response = FileResponse(
+                    coding_path,
+                    status_code=status_code,
+                    headers={"Content-Encoding": coding, "Vary": "Accept-Encoding"},
+                    media_type=guess_type(str(full_path))[0] or "text/plain",
+                    stat_result=coding_stat,
+                    method=scope["method"],
+                )
+
+                if self.is_not_modified(response.headers, request_headers):
+                    return NotModifiedResponse(response.headers)
+
+                return response
+
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers.setdefault("Vary", "Accept-Encoding")
+
+        return response
@@ -1,6 +1,6 @@
 import os
 from typing import Any, Type
-from urllib.parse import unquote, urlparse
+from urllib.parse import parse_qs, unquote, urlparse
 
 from bs4 import BeautifulSoup, NavigableString, Tag
 from dotenv import load_dotenv
@@ -16,13 +16,15 @@ config = read_settings()
 MEDIA_DIR = os.getenv("MEDIA_DIR")
 
 
-def link_rewrite_to_canonical_url(link: Type[Tag]) -> None:
+def link_rewrite_to_canonical_url(link: Type[Tag]) -> dict[str, str]:
     """
     Given a URL like:
     https://hackersanddesigners.nl (no subdomain)
 
     Rewrite it to be in relative format, eg.
     pointing to a page in *this* wiki.
+
+    Return the title and slug of the page the link points to.
     """
 
     url_parse = urlparse(link.attrs["href"])
@@ -36,6 +38,10 @@ def link_rewrite_to_canonical_url(link: Type[Tag]) -> None:
     else:
         link.attrs["href"] = uri
 
+    uri_title = unquote(url_parse.path.split("/")[-1]).replace("_", " ")
+
+    return {"title": uri_title, "slug": uri}
+
 
 def link_image_update(link: Type[Tag], img_tag: Type[Tag], mw_url: str) -> None:
     """
@@ -170,10 +176,12 @@ def link_rewrite_image_url(link: Type[Tag], mw_url: str) -> None:
             link_image_update(link, img_tag, mw_url)
 
 
-def link_rewrite_other_url(link: Type[Tag]) -> None:
+def link_rewrite_other_url(link: Type[Tag]) -> dict[str, str] | None:
     """
     Update URL for any other link that is not pointing
     to a `File:`.
+
+    Return the title and slug of the page the link points to.
     """
 
     if "=File:" not in link.attrs["href"]:
@@ -190,6 +198,15 @@ def link_rewrite_other_url(link: Type[Tag]) -> None:
         else:
             link.attrs["href"] = f"/{uri}"
 
+        # links to pages not existing yet in the wiki (red links)
+        # are not links to any article
+        query = parse_qs(url_parse.query)
+        if "title" in query and "redlink" not in query:
+            title = query["title"][0].replace("_", " ")
+            return {"title": title, "slug": slugify(title)}
+
+    return None
+
 
 def strip_thumb(thumb: Type[Tag]) -> None:
     """
@@ -218,37 +235,44 @@ def strip_thumb(thumb: Type[Tag]) -> None:
 
 
 def post_process(
-    article: str,
+    soup: BeautifulSoup,
     file_URLs: list[str],
     HTML_MEDIA_DIR: str,
     redirect_target: str | None = None,
 ):
     """
-    Update article HTML before saving it to disk:
+    Update article HTML (already parsed into soup, see `parser`)
+    before saving it to disk:
     - update links
     - extract list of images URLs
     - manipulate and clean-up HTML for better design
     - extract repo URL from <tool> HTML
+    - extract list of the wiki articles the article links to
+    - extract the article text, for the search index
     """
 
     canonical_url = config["domain"]["canonical_url"]
     mw_url = config["domain"]["mw_url"]
 
-    soup = BeautifulSoup(article, "lxml")
-
     # -- update URLs for File: and any other URL type
     links = soup.find_all("a")
+    article_links = {}
     for link in links:
         if "title" in link.attrs:
             link.attrs["title"] = link.text
 
         if link.has_attr("href"):
+            article_link = None
+
             if link.attrs["href"].startswith(canonical_url):
-                link_rewrite_to_canonical_url(link)
+                article_link = link_rewrite_to_canonical_url(link)
 
             elif link.attrs["href"].startswith("/index.php"):
                 link_rewrite_image_url(link, mw_url)
-                link_rewrite_other_url(link)
+                article_link = link_rewrite_other_url(link)
+
+            if article_link is not None and article_link["slug"]:
+                article_links[article_link["slug"]] = article_link
 
     # -- dethumbify images
     thumbs = soup.select(".thumb img")
@@ -279,12 +303,14 @@ def post_process(
 
     # -- return article HTML
     # the wiki article can be empty
-    # therefore soup.contents is an empty list
-    if len(soup.contents) > 0:
-        t = "".join(str(item) for item in soup.body.contents)
-        article = t
+    # therefore soup.body is None
+    article = ""
+    text = ""
+    if soup.body is not None:
+        article = soup.body.decode_contents()
+        text = soup.body.get_text(" ", strip=True)
 
-    return article, imageURLs, repos_index
+    return article, text, imageURLs, repos_index, list(article_links.values())
 
 
 def get_table_data_row(table_key: str, td: Type[Tag]) -> str | None:
@@ -312,18 +338,19 @@ def get_table_data_row(table_key: str, td: Type[Tag]) -> str | None:
         return ", ".join(table_row)
 
 
-def get_data_from_HTML_table(article_html: str) -> dict[Any, str | None]:
+def get_data_from_HTML_table(soup: BeautifulSoup) -> dict[Any, str | None]:
     """
     Extracts data from HTML's <tbody> tag: we map over
     each <th> element and check if it matches against any
     of the specified keys in table_keys. Those keys are taken
     from MW's own table keys and it's the subset of data we
     care about.
+
+    The table is only read, and is left in the article HTML.
     """
 
     table_keys = ["Name", "Location", "Date", "Time", "PeopleOrganisations", "Type"]
 
-    soup = BeautifulSoup(article_html, "lxml")
     table = soup.find("tbody")
 
     # <tr> => table-row
@@ -349,16 +376,14 @@ def get_data_from_HTML_table(article_html: str) -> dict[Any, str | None]:
                                 table_key, tr.td
                             )
 
-        table.decompose()
-
     return info
 
 
 def get_metadata(
-    article: dict[str, str | list[dict[str, str]]]
+    article: dict[str, str | list[dict[str, str]]], soup: BeautifulSoup
 ) -> dict[str, dict[str, str] | list[str]]:
     """
-    Extract wiki template tags from article, if any.
+    Extract wiki template tags from article (parsed into soup), if any.
     Extract article's categories too.
     """
 
@@ -367,7 +392,7 @@ def get_metadata(
         "categories": [],
     }
 
-    info = get_data_from_HTML_table(article["text"])
+    info = get_data_from_HTML_table(soup)
     metadata["info"] = info
 
     cats = config["wiki"]["categories"]
@@ -417,25 +442,34 @@ def parser(
     Parse given article dictionary by:
     - extracting metadata (images, categories, templates, tables, etc.)
     - post-process HTML (fix links, extract Tool metadata, etc.)
+
+    The article HTML is parsed once, and every step
+    works on the same soup.
     """
 
     print(f"parsing article {article['title']}")
 
     HTML_MEDIA_DIR = "/".join(MEDIA_DIR.split("/")[1:])
 
+    soup = BeautifulSoup(article["text"], "lxml")
+
     imageURLs = []
     repos_index = []
-    metadata = get_metadata(article)
+    links = []
+    text = ""
+    metadata = get_metadata(article, soup)
 
     if "is_styles_page" in article and "wikitext" in article:
         body_html = article["wikitext"]
 
     else:
-        body_html, imageURLs, repos_index = post_process(
-            article["text"], article["images"], HTML_MEDIA_DIR, redirect_target
+        body_html, text, imageURLs, repos_index, links = post_process(
+            soup, article["images"], HTML_MEDIA_DIR, redirect_target
         )
 
     metadata["repos_index"] = repos_index
+    metadata["links"] = links
+    metadata["text"] = text
 
     print(f"parsed {article['title']}!")
 
@@ -0,0 +1,124 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+
+from app.file_ops import set_file_index
+from app.parser import parser
+from app.views.template_utils import get_environment
+
+load_dotenv()
+
+
+# number of worker processes parsing and rendering articles during
+# a full build: `0` to do it in the main process, `auto` for one
+# worker per CPU core
+BUILD_WORKERS = os.getenv("BUILD_WORKERS", "0")
+
+pool: ProcessPoolExecutor | None = None
+
+# True inside a worker process of the pool
+in_worker = False
+
+
+def get_workers() -> int:
+    """
+    Return the number of worker processes to start, from BUILD_WORKERS.
+    """
+
+    if BUILD_WORKERS == "auto":
+        return os.cpu_count() or 1
+
+    return int(BUILD_WORKERS)
+
+
+def init_worker() -> None:
+    global in_worker
+
+    in_worker = True
+
+
+def start_pool() -> None:
+    """
+    Start the process pool, if BUILD_WORKERS is set: from now on
+    `run_in_pool` runs its function in one of the worker processes.
+
+    Workers are spawned rather than forked, so they don't inherit
+    the event loop, the HTTP client or the SQLite connection of
+    the main process.
+    """
+
+    global pool
+
+    workers = get_workers()
+
+    if pool is not None or workers < 1:
+        return
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+    )
+    print(f"process-pool => started {workers} workers")
+
+
+def close_pool() -> None:
+    """
+    Shut the process pool down, if running.
+    """
+
+    global pool
+
+    if pool is not None:
+        pool.shutdown()
+        pool = None
+
+
+async def run_in_pool(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run func with the given (picklable) arguments in the process pool
+    and return its (picklable) result, without blocking the event loop.
+
+    If the pool is not running, just call func.
+    """
+
+    if pool is None:
+        return func(*args)
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(pool, func, *args)
+
+
+def parse_article(
+    article: dict[str, str | list[dict[str, str]]],
+    redirect_target: str | None = None,
+    file_index: set[str] | None = None,
+):
+    """
+    Run `parser` on the given article.
+
+    In a worker process we use the file index of the main process,
+    passed along with the article, since the main process keeps
+    writing new files to WIKI_DIR (and scanning it again for every
+    article would be slow).
+    """
+
+    if in_worker and file_index is not None:
+        set_file_index(file_index)
+
+    return parser(article, redirect_target)
+
+
+def render_template(
+    template_name: str, article: dict[str, list[str] | list[dict[str, str]]]
+) -> str:
+    """
+    Render the given template (by name, eg `article.html`) with the article.
+    """
+
+    return get_environment().get_template(template_name).render(article=article)
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+API_MAX_IN_FLIGHT = int(os.getenv("API_MAX_IN_FLIGHT", "16"))
+API_RATE = float(os.getenv("API_RATE", "20"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "5"))
+API_RETRY_BUDGET = float(os.getenv("API_RETRY_BUDGET", "20"))
+
+# every successful request adds this much to the retry budget
+RETRY_RATIO = 0.1
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    """
+    Let through at most `rate` requests per second on average, with
+    bursts of up to `rate` requests.
+
+    The rate adapts to how MediaWiki is doing: it is halved every time
+    MediaWiki tells us to slow down (`slow_down`), and it grows back
+    a bit after every successful request (`speed_up`), up to `max_rate`.
+    """
+
+    def __init__(self, rate: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Let no request through for the given number of seconds.
+        """
+
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def slow_down(self) -> None:
+        self.rate = max(1.0, self.rate / 2)
+        self.tokens = min(self.tokens, self.rate)
+        print(f"rate-limit => slowing down to {self.rate:.1f} req/s")
+
+    def speed_up(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class RetryBudget:
+    """
+    Cap the number of retries to a share of the successful requests
+    (plus an initial allowance), so that when MediaWiki is down we
+    give up quickly instead of multiplying the load with retries.
+    """
+
+    def __init__(self, budget: float):
+        self.max_budget = budget
+        self.budget = budget
+
+    def deposit(self) -> None:
+        self.budget = min(self.max_budget, self.budget + RETRY_RATIO)
+
+    def withdraw(self) -> bool:
+        if self.budget < 1:
+            return False
+
+        self.budget -= 1
+        return True
+
+
+# limiter state shared by every request of the process,
+# re-created when running in a new event loop
+limiter_loop = None
+in_flight: asyncio.Semaphore | None = None
+bucket = TokenBucket(API_RATE)
+retry_budget = RetryBudget(API_RETRY_BUDGET)
+
+
+def get_in_flight() -> asyncio.Semaphore:
+    """
+    Return the semaphore capping the number of requests
+    running at the same time to API_MAX_IN_FLIGHT.
+    """
+
+    global limiter_loop, in_flight
+
+    loop = asyncio.get_running_loop()
+
+    if in_flight is None or limiter_loop is not loop:
+        in_flight = asyncio.Semaphore(API_MAX_IN_FLIGHT)
+        limiter_loop = loop
+
+    return in_flight
+
+
+def get_backoff(attempt: int) -> float:
+    """
+    Return the number of seconds to wait before the given retry attempt:
+    exponential backoff with full jitter, see
+    <https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/>.
+    """
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def get_retry_after(value: str | None) -> float | None:
+    """
+    Return the number of seconds of the given Retry-After header
+    value (either a number of seconds or an HTTP date), if any.
+    """
+
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,154 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from app.db import get_db
+from app.fetch import fetch_recent_changes
+
+load_dotenv()
+
+
+# number of seconds between two polls of MediaWiki's recent changes,
+# `0` to disable reconciliation
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "300"))
+
+
+def get_cursor() -> dict[str, str | int] | None:
+    """
+    Return the recent changes cursor: the rcid and timestamp of the
+    last recent change seen, if any.
+    """
+
+    db = get_db()
+    rows = db.execute(
+        "SELECT name, value FROM cursors WHERE name IN ('rcid', 'rc_timestamp')"
+    ).fetchall()
+
+    values = {row["name"]: row["value"] for row in rows}
+
+    if len(values) < 2:
+        return None
+
+    return {"rcid": int(values["rcid"]), "timestamp": values["rc_timestamp"]}
+
+
+def set_cursor(rcid: int, timestamp: str) -> None:
+    """
+    Save the rcid and timestamp of the last recent change seen.
+    """
+
+    db = get_db()
+    db.executemany(
+        "INSERT OR REPLACE INTO cursors (name, value) VALUES (?, ?)",
+        [("rcid", str(rcid)), ("rc_timestamp", timestamp)],
+    )
+    db.commit()
+
+
+def make_message(change: dict) -> dict:
+    """
+    Convert the given recent change, as returned by the APIs,
+    into the same shape as a UDP message from wgRCFeeds.
+    """
+
+    msg = {
+        "id": change["rcid"],
+        "type": change["type"],
+        "namespace": change["ns"],
+        "title": change["title"],
+        "timestamp": change["timestamp"],
+    }
+
+    if change["type"] == "log":
+        params = change.get("logparams", {})
+
+        msg["log_type"] = change.get("logtype")
+        msg["log_action"] = change.get("logaction")
+        msg["log_params"] = params
+
+        if msg["log_type"] == "move":
+            # no-redirect:
+            # - 0 => make redirect
+            # - 1 => no redirect
+            msg["log_params"] = {
+                "target": params.get("target_title"),
+                "noredir": "1" if params.get("suppressredirect") else "0",
+            }
+
+    return msg
+
+
+async def reconcile(protocol, client) -> None:
+    """
+    Fetch the recent changes made since the cursor, and pass them to
+    the server (see `RCFeedProtocol.receive`) as if they had just been
+    received through UDP: the ones the journal has already are skipped,
+    the others (eg their UDP message got lost) are processed.
+
+    On first run, we only set the cursor to now.
+    """
+
+    cursor = get_cursor()
+
+    if cursor is None:
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        set_cursor(0, now)
+        return
+
+    changes = await fetch_recent_changes(cursor["timestamp"], client)
+
+    rcid = cursor["rcid"]
+    timestamp = cursor["timestamp"]
+    missed = 0
+
+    for change in changes:
+        if change["rcid"] <= cursor["rcid"]:
+            continue
+
+        if protocol.receive(make_message(change)):
+            missed += 1
+
+        rcid = max(rcid, change["rcid"])
+        timestamp = max(timestamp, change["timestamp"])
+
+    set_cursor(rcid, timestamp)
+
+    if missed > 0:
+        print(f"reconcile => {missed} changes missed by the UDP server")
+
+
+async def watch_recent_changes(protocol, client, stop_event: asyncio.Event) -> None:
+    """
+    Run `reconcile` every RECONCILE_INTERVAL seconds, so that
+    changes whose UDP message got lost are built within a bounded delay.
+
+    Every time, the messages of the journal not processed yet (eg
+    failed ones, or dropped as the queue was full) are put back in
+    the queue too (see `RCFeedProtocol.replay`).
+
+    Set stop_event to stop watching.
+    """
+
+    if RECONCILE_INTERVAL <= 0:
+        return
+
+    while not stop_event.is_set():
+        try:
+            await reconcile(protocol, client)
+
+        except Exception as e:
+            print(f"reconcile err => {e}")
+
+        try:
+            protocol.replay()
+
+        except Exception as e:
+            print(f"reconcile :: replay err => {e}")
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=RECONCILE_INTERVAL)
+
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,169 @@
+import asyncio
+import os
+from functools import lru_cache
+
+from slugify import slugify
+
+from app.db import get_db
+from app.read_settings import main as read_settings
+
+config = read_settings()
+
+REDIRECTS_RELOAD = float(os.getenv("REDIRECTS_RELOAD", "10"))
+
+# last segment of a legacy hd-www-v1 URI (eg `Coding_in_Situ` in
+# `s/Summer_Camp_2023/p/Coding_in_Situ`) => (target URI, status code)
+legacy_redirects: dict[str, tuple[str, int]] = {}
+
+# slug of a moved article => (target URI, status code)
+moved_redirects: dict[str, tuple[str, int]] = {}
+
+
+def make_legacy_key(title: str) -> str:
+    """
+    Return the last segment of the hd-www-v1 URI of the given article title.
+    """
+
+    return title.replace(" ", "_")
+
+
+def add_legacy_redirect(title: str, slug: str) -> None:
+    """
+    Redirect the hd-www-v1 URIs of the given article title to its slug.
+    """
+
+    db = get_db()
+    db.execute(
+        "INSERT OR REPLACE INTO redirects (kind, source, target, status)"
+        " VALUES ('legacy', ?, ?, 301)",
+        (make_legacy_key(title), slug),
+    )
+    db.commit()
+
+
+def add_moved_redirect(source_slug: str, target_slug: str) -> None:
+    """
+    Redirect the given (moved) article slug to the slug of its new title.
+    """
+
+    db = get_db()
+    db.execute(
+        "INSERT OR REPLACE INTO redirects (kind, source, target, status)"
+        " VALUES ('moved', ?, ?, 301)",
+        (source_slug, target_slug),
+    )
+    db.commit()
+
+
+def remove_redirects(title: str, slug: str) -> None:
+    """
+    Remove the redirects of the given article title and slug,
+    eg when the article is deleted or when a new article
+    takes the slug of a moved one.
+    """
+
+    db = get_db()
+    db.execute(
+        "DELETE FROM redirects WHERE (kind = 'legacy' AND source = ?)"
+        " OR (kind = 'moved' AND source = ?)",
+        (make_legacy_key(title), slug),
+    )
+    db.commit()
+
+
+def load_redirect_map() -> None:
+    """
+    (Re-)load the redirect map from the build database.
+    """
+
+    global legacy_redirects, moved_redirects
+
+    rows = get_db().execute("SELECT * FROM redirects").fetchall()
+
+    legacy_redirects = {
+        row["source"]: (row["target"], row["status"])
+        for row in rows
+        if row["kind"] == "legacy"
+    }
+    moved_redirects = {
+        row["source"]: (row["target"], row["status"])
+        for row in rows
+        if row["kind"] == "moved"
+    }
+
+
+async def watch_redirect_map(stop_event: asyncio.Event) -> None:
+    """
+    Reload the redirect map every REDIRECTS_RELOAD seconds, if the build
+    database has been changed by another process (eg the UDP server
+    or a CLI build command) in the meantime.
+
+    Set stop_event to stop watching.
+    """
+
+    db = get_db()
+    version = db.execute("PRAGMA data_version").fetchone()[0]
+
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=REDIRECTS_RELOAD)
+
+        except asyncio.TimeoutError:
+            pass
+
+        new_version = db.execute("PRAGMA data_version").fetchone()[0]
+        if new_version != version:
+            version = new_version
+            load_redirect_map()
+
+
+@lru_cache(maxsize=4096)
+def make_legacy_redirect(key: str) -> tuple[str, int]:
+    """
+    Return the redirect of a legacy hd-www-v1 URI segment
+    not matching any article in the redirect map.
+
+    Special case: summer academy / camp pages redirect
+    to the Event index filtered by type, eg
+    - s/Summer_Camp_2023 => activities?type=hdsc2023
+    """
+
+    new_uri = slugify(key)
+
+    if new_uri.startswith("summer-academy") or new_uri.startswith("summer-camp"):
+        summer_tokens = new_uri.split("-")
+        summer_type = summer_tokens[-2][0].lower()
+        summer_year = summer_tokens[-1]
+        event_label = slugify(config["wiki"]["categories"]["Event"]["label"])
+
+        return f"{event_label}?type=hds{summer_type}{summer_year}", 308
+
+    return new_uri, 301
+
+
+def get_redirect(uri: str) -> tuple[str, int] | None:
+    """
+    Return the target URI and status code to redirect
+    the given URI to, if any.
+
+    -- examples of old-style URIs:
+    p/About
+    s/Collaborators
+    special case:
+    - s/Summer_Camp_2023 => activities?type=hdsc2023
+    - s/Summer_Camp_2023/p/Open_Call!_H%26D_Summer_Camp_2023_-_HopePunk%3A_
+      Reknitting_Collective_Infrastructures
+    - s/Summer_Camp_2023/p/Coding_in_Situ
+    """
+
+    tokens = uri.split("/")
+
+    if len(tokens) > 1:
+        key = tokens[-1]
+
+        if key in legacy_redirects:
+            return legacy_redirects[key]
+
+        return make_legacy_redirect(key)
+
+    return moved_redirects.get(uri.removesuffix(".html"))
@@ -0,0 +1,119 @@
+import html
+from typing import Any
+
+from app.db import get_db
+
+# markers wrapped around matched terms by FTS5's snippet function,
+# replaced with HTML once the snippet text has been escaped
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+
+def update_search_index(article: dict[str, list[str] | list[dict[str, str]]]) -> None:
+    """
+    Add or update the given article in the full-text search index:
+    title, body text, categories and parsed metadata (the infobox).
+    """
+
+    metadata = article["metadata"]
+
+    # the body text is extracted by `parser.post_process`
+    body = metadata["text"]
+
+    parsed_metadata = " ".join(
+        value
+        for value in metadata["parsed_metadata"].values()
+        if isinstance(value, str)
+    )
+
+    db = get_db()
+    db.execute("DELETE FROM search WHERE slug = ?", (article["slug"],))
+    db.execute(
+        "INSERT INTO search"
+        " (slug, title, body, categories, metadata, timestamp, wordcount)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            article["slug"],
+            article["title"],
+            body,
+            " ".join(metadata["categories"]),
+            parsed_metadata,
+            metadata["timestamps"]["last_modified"],
+            len(body.split()),
+        ),
+    )
+    db.commit()
+
+
+def remove_from_search_index(slug: str) -> None:
+    """
+    Remove the given article slug from the full-text search index.
+    """
+
+    db = get_db()
+    db.execute("DELETE FROM search WHERE slug = ?", (slug,))
+    db.commit()
+
+
+def make_match_query(query: str) -> str:
+    """
+    Convert the given user query into an FTS5 query matching
+    every word of it, quoting each word so that characters
+    part of the FTS5 syntax (eg `"`, `*`, `:`, `-`) are
+    matched as text.
+    """
+
+    words = [word.replace('"', '""') for word in query.split()]
+
+    return " ".join(f'"{word}"' for word in words)
+
+
+def search_articles(
+    query: str, limit: int, offset: int
+) -> tuple[int, list[dict[str, Any]]]:
+    """
+    Run the given query against the full-text search index and return
+    the total number of matches, and the matches between offset
+    and offset + limit, ranked by relevance (title first, then
+    parsed metadata, categories and body text).
+    """
+
+    match = make_match_query(query)
+
+    if match == "":
+        return 0, []
+
+    db = get_db()
+
+    total = db.execute(
+        "SELECT count(*) FROM search WHERE search MATCH ?", (match,)
+    ).fetchone()[0]
+
+    rows = db.execute(
+        "SELECT slug, title, timestamp, wordcount,"
+        " snippet(search, 2, ?, ?, '…', 24) AS snippet"
+        " FROM search WHERE search MATCH ?"
+        " ORDER BY bm25(search, 0.0, 10.0, 1.0, 2.0, 4.0)"
+        " LIMIT ? OFFSET ?",
+        (MATCH_START, MATCH_END, match, limit, offset),
+    ).fetchall()
+
+    results = []
+    for row in rows:
+        snippet = (
+            html.escape(row["snippet"])
+            .replace(MATCH_START, '<span class="searchmatch">')
+            .replace(MATCH_END, "</span>")
+        )
+
+        results.append(
+            {
+                "title": row["title"],
+                "slug": row["slug"],
+                "timestamp": row["timestamp"],
+                "wordcount": row["wordcount"],
+                "snippet": snippet,
+            }
+        )
+
+    return total, results
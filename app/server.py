@@ -1,12 +1,13 @@
 import asyncio
 import json
 import os
-import socket
 import traceback
 
-import httpx
 from dotenv import load_dotenv
+from slugify import slugify
 
+from app.article_locks import article_lock
+from app.article_store import add_article, make_store
 from app.build_article import (
     delete_article,
     make_article,
@@ -17,167 +18,495 @@ from app.build_article import (
 )
 from app.build_category_index import update_categories
 from app.build_front_index import build_front_index
-from app.fetch import convert_article_trans_title_to_regular_title, create_context
+from app.event_schedule import watch_event_boundaries
+from app.fetch import (
+    close_client,
+    convert_article_trans_title_to_regular_title,
+    get_client,
+)
+from app.file_ops import build_file_index, watch_file_index
+from app.journal import (
+    append_to_journal,
+    get_unprocessed,
+    mark_failed,
+    mark_processed,
+    prune_journal,
+)
+from app.link_graph import diff_links, get_linked_pages
 from app.pretty_json_log import main as pretty_json_log
-from app.views.template_utils import get_template
+from app.reconcile import watch_recent_changes
+from app.views.template_utils import get_template, precompile_templates
 
 load_dotenv()
 
 
-async def main(SERVER_IP: str | None, SERVER_PORT: int, ENV: str | None) -> None:
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "4"))
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "1000"))
+SERVER_DEBOUNCE = float(os.getenv("SERVER_DEBOUNCE", "2"))
+
+# when several messages for the same article are coalesced
+# we keep the one with the strongest operation, unless an edit
+# comes after a delete (see `RCFeedProtocol.coalesce`)
+OPERATION_RANKS = {"edit": 0, "move": 1, "delete": 2}
+
+# category index pages and the frontpage are shared by every
+# article: we update them one article at a time, else two workers
+# might read and write back the same file, losing one of the updates
+site_lock = asyncio.Lock()
+
+# ids of the journal messages pending, queued or being processed,
+# so `RCFeedProtocol.replay` never puts them in the queue twice
+active_ids: set[int] = set()
+
+
+class RCFeedProtocol(asyncio.DatagramProtocol):
     """
-    Server function that:
-    - listens to UDP message coming from the specified MediaWiki instance at SERVER_PORT
-    - fetches article by title using data from UDP message
-    - post-process article data and save it to disk as HTML
+    Receive UDP messages from MediaWiki's wgRCFeeds and put them in the
+    queue, without waiting for the message to be processed, so no other
+    message is left waiting in the kernel buffer in the meantime.
+
+    A single save in MediaWiki often sends several messages (the edit,
+    each translation unit, log entries, etc.): we wait for SERVER_DEBOUNCE
+    seconds without new messages for an article, then put one message
+    in the queue for it, carrying the strongest operation received
+    (delete > move > edit), unless the article has been re-created or
+    restored after being deleted: then the later edit wins.
+
+    Every message is appended to the journal (see `app/journal.py`)
+    before anything else, and carries the ids of the journal messages
+    it has been merged from, so the worker can mark them as processed.
     """
 
-    server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server_sock.bind((SERVER_IP, SERVER_PORT))
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+        self.pending: dict[str, dict] = {}
 
-    print(
-        "UDP server has started and is ready to receive...", f"{SERVER_IP, SERVER_PORT}"
-    )
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        try:
+            msg = json.loads(data)
 
-    template = get_template("article")
-    sem = None
-    context = create_context(ENV)
+        except json.JSONDecodeError as e:
+            print(f"server :: could not decode message from {addr} => {e}")
+            return
 
-    async with httpx.AsyncClient(verify=context) as client:
+        pretty_json_log(msg)
 
-        while True:
-            data, addr = server_sock.recvfrom(2048)
-            msg = json.loads(data)
-            pretty_json_log(msg)
+        self.receive(msg)
+
+    def receive(self, msg: dict) -> bool:
+        """
+        Append the given message to the journal and coalesce it.
+
+        Return False if the message points to an article we don't
+        parse, or if the journal has the message already (eg received
+        both through UDP and through `reconcile.py`).
+        """
+
+        article_title = get_article_title(msg)
+        if article_title is None:
+            return False
+
+        journal_id = append_to_journal(msg, article_title)
+        if journal_id is None:
+            return False
+
+        self.coalesce(msg, article_title, [journal_id])
+
+        return True
+
+    def coalesce(self, msg: dict, article_title: str, ids: list[int]) -> None:
+        """
+        Merge the given message with the pending one for the same
+        article, if any, and (re-)start the quiet window.
+
+        Messages must be given in the order they have been received:
+        an edit (new, edit, restore) following a delete replaces it,
+        as the article exists again.
+        """
+
+        loop = asyncio.get_running_loop()
+        operation = get_operation(msg)
+
+        entry = self.pending.get(article_title)
+
+        if entry is None:
+            entry = {"msg": msg, "operation": operation, "ids": [], "handle": None}
+            self.pending[article_title] = entry
+
+        else:
+            entry["handle"].cancel()
+
+            rank = OPERATION_RANKS.get(operation, -1)
+            recreated = operation == "edit" and entry["operation"] == "delete"
+            if recreated or rank >= OPERATION_RANKS.get(entry["operation"], -1):
+                entry["msg"] = msg
+                entry["operation"] = operation
+
+            print(f"server :: coalesced message for {article_title}")
+
+        entry["ids"].extend(ids)
+        active_ids.update(ids)
+        entry["handle"] = loop.call_later(SERVER_DEBOUNCE, self.enqueue, article_title)
+
+    def enqueue(self, article_title: str) -> None:
+        """
+        Put the pending message of the given article in the queue.
+        """
+
+        entry = self.pending.pop(article_title)
+
+        try:
+            self.queue.put_nowait((entry["msg"], article_title, entry["ids"]))
+
+        except asyncio.QueueFull:
+            print(
+                f"server :: queue is full ({self.queue.maxsize}), "
+                f"dropping message (kept in the journal) => {entry['msg']}"
+            )
+
+            # let `replay` put it back in the queue later on
+            active_ids.difference_update(entry["ids"])
+
+    def replay(self) -> None:
+        """
+        Put back in the queue the messages of the journal that have not
+        been processed, eg because the server stopped while processing
+        them, processing them failed, or the queue was full.
+
+        Run on start, then by `reconcile.watch_recent_changes` every
+        RECONCILE_INTERVAL seconds, so the server catches up without
+        a restart. Messages already on their way are skipped.
+        """
+
+        entries = [
+            entry for entry in get_unprocessed() if entry["id"] not in active_ids
+        ]
+
+        if len(entries) > 0:
+            print(f"server :: replaying {len(entries)} messages from the journal")
+
+        for entry in entries:
+            self.coalesce(entry["msg"], entry["title"], [entry["id"]])
+
+
+def get_operation(msg: dict) -> str | None:
+    """
+    Return the operation (edit, move, delete) of the given message,
+    following the same checks done in `handle_message`.
+    """
+
+    if (
+        msg["type"] in ["new", "edit"]
+        or msg["type"] == "log"
+        and msg["log_action"] in ["restore", "delete_redir"]
+    ):
+        return "edit"
+
+    elif msg["type"] == "log":
+        if msg["log_type"] == "delete" and msg["log_action"] == "delete":
+            return "delete"
+
+        elif msg["log_type"] == "move" and msg["log_action"] == "move":
+            return "move"
+
+    return None
+
+
+def get_article_title(msg: dict) -> str | None:
+    """
+    Return the article title of the given message, or None
+    if the message points to an article we don't parse.
+    """
+
+    article_title = msg["title"]
+
+    # namespace: -1 is part of Special Pages, we don't parse those
+    if msg["namespace"] == -1:
+        return None
+
+    # filter out `Concept:<title>` articles
+    if article_title.startswith("Concept:"):
+        return None
 
-            # -- we have the UPD message, let's read the operation
-            #    type (new, edit, delete) and run appropriate function
+    # filter our `Special:<title>` articles
+    if article_title.startswith("Special:"):
+        return None
 
-            article_title = msg["title"]
+    # -- check if article is a snippet translation
+    #    eg `<title>/<num-version>/<lang>
+    #    and instead convert Title to regular article
+    #    so we updated it, instead of ignoring the
+    #    translation snippet.
+    return convert_article_trans_title_to_regular_title(article_title)
 
-            # namespace: -1 is part of Special Pages, we don't parse those
-            if msg["namespace"] == -1:
-                return
 
-            # filter out `Concept:<title>` articles
-            if article_title.startswith("Concept:"):
-                return
+async def handle_message(msg: dict, article_title: str, client, template) -> bool:
+    """
+    Read the operation type (new, edit, delete, move) of the given
+    message and run the appropriate functions.
 
-            # filter our `Special:<title>` articles
-            if article_title.startswith("Special:"):
-                return
+    Return False if processing the message failed.
+    """
 
-            # -- check if article is a snippet translation
-            #    eg `<title>/<num-version>/<lang>
-            #    and instead convert Title to regular article
-            #    so we updated it, instead of ignoring the
-            #    translation snippet.
-            article_title = convert_article_trans_title_to_regular_title(article_title)
+    sem = None
 
-            if (
-                msg["type"] in ["new", "edit"]
-                or msg["type"] == "log"
-                and msg["log_action"] in ["restore", "delete_redir"]
-            ):
+    if (
+        msg["type"] in ["new", "edit"]
+        or msg["type"] == "log"
+        and msg["log_action"] in ["restore", "delete_redir"]
+    ):
+
+        try:
+            # -- first the article itself, holding its lock from fetch
+            #    to write, so two edits never save it out of order
+            async with article_lock(slugify(article_title)):
+                # a failed fetch raises, so the message is marked as failed
+                # and replayed, instead of being taken for a deleted article
+                article = await make_article(article_title, client, raise_errors=True)
+
+                if article:
+                    # -- compare the article links with the ones of its last
+                    #    build, and look up the pages linked to it before
+                    #    saving the article updates the link graph
+                    links = article["metadata"]["links"]
+                    links_diff = diff_links(article["slug"], links)
+                    linked = get_linked_pages(article["slug"])
+
+                    # -- write article to disk
+                    filepath = f"{article['slug']}"
+                    await save_article(article, filepath, template, sem)
+
+            # -- then the other pages, each one under its own lock
+            #    (see `article_lock`), once the article lock is released
+            if not article:
+                print(
+                    f"server :: new / edit op: no article found\n"
+                    f"  for => {article_title}"
+                )
 
+            else:
+                kept = [link["slug"] for link in links_diff["kept"]]
+
+                async with site_lock:
+                    # -- if we remove a category from an article
+                    # we need to remove its traces from the website
+                    removed_cats = await remove_article_traces(
+                        article_title, kept, linked
+                    )
+
+                    # -- then, update every category index page the article has
+                    #    and write it to disk
+                    await update_categories(article)
+
+                # -- update the backlinks of the articles it links to now,
+                #    or not anymore
+                changed_links = [*links_diff["added"], *links_diff["removed"]]
+                await update_backlinks(changed_links, skip=[article["slug"]])
+
+                # update front-index if necessary, reusing the article
+                # if it is the frontpage one, and built from the revision
+                # of the message (edits have one, restores don't)
+                store = make_store()
+                add_article(store, article)
+                revid = msg.get("revision", {}).get("new")
+
+                # the categories it has been removed from count too,
+                # eg an article taken out of the highlights
+                async with site_lock:
+                    art_title = article["title"]
+                    art_cats = [
+                        *article["metadata"]["categories"],
+                        *[slugify(cat) for cat in removed_cats],
+                    ]
+                    await build_front_index(art_title, art_cats, store, revid)
+
+        except Exception as e:
+            print(f"make-article err ({article_title}) => {e}")
+            traceback.print_exc()
+            return False
+
+    elif msg["type"] == "log":
+
+        if msg["log_type"] == "delete":
+
+            if msg["log_action"] == "delete":
                 try:
-                    article = await make_article(article_title, client)
+                    # -- look up the pages linked to the article first:
+                    #    delete_article removes its links from the link graph
+                    async with article_lock(slugify(article_title)):
+                        linked = get_linked_pages(slugify(article_title))
+                        await delete_article(article_title)
 
-                    if not article:
-                        print(
-                            f"server :: new / edit op: no article found\n"
-                            f"  for => {article_title}"
-                        )
+                    async with site_lock:
+                        await remove_article_traces(article_title, linked=linked)
+
+                        # update front-index if necessary
+                        art_cats = None
+                        await build_front_index(article_title, art_cats)
+
+                except Exception as e:
+                    print(f"delete article err => {e}")
+                    traceback.print_exc()
+                    return False
 
-                    else:
+        elif msg["log_type"] == "move":
 
-                        # -- if we remove a category from an article
-                        # we need to remove its traces from the website
-                        await remove_article_traces(article_title)
+            # we honor user's preference in the MW Move Article page:
+            # if leave redirect behind is toggled, we leave the previous page
+            # else we remove it, including any URL traces across the wiki
 
-                        # -- then, update every category index page the article has
-                        #    and write it to disk
-                        # -- update article backlinks
-                        await update_categories(article)
-                        await update_backlinks(article)
+            if msg["log_action"] in ["move", "delete_redir"]:
+                try:
+                    redirect = msg["log_params"]
+
+                    # no-redirect:
+                    # - 0 => make redirect
+                    # - 1 => no redirect
+                    make_redirect = False
+                    if "noredir" in redirect and redirect["noredir"] == "0":
+                        make_redirect = True
+
+                    async with article_lock(slugify(redirect["target"])):
+                        target = await make_article(
+                            redirect["target"], client, raise_errors=True
+                        )
+                        await save_article(target, target["slug"], template, sem)
+
+                    async with site_lock:
+                        await update_categories(target)
 
                         # update front-index if necessary
-                        art_title = article["title"]
-                        art_cats = article["metadata"]["categories"]
+                        art_title = target["title"]
+                        art_cats = target["metadata"]["categories"]
                         await build_front_index(art_title, art_cats)
 
-                        # -- write article to disk
-                        filepath = f"{article['slug']}"
-                        await save_article(article, filepath, template, sem)
+                    async with article_lock(slugify(article_title)):
+                        if make_redirect:
+                            target_redirect = {
+                                "title": target["title"],
+                                "slug": target["slug"],
+                            }
+
+                            await make_redirect_article(article_title, target_redirect)
+
+                        else:
+                            linked = get_linked_pages(slugify(article_title))
+                            await delete_article(article_title)
+
+                    if not make_redirect:
+                        async with site_lock:
+                            await remove_article_traces(article_title, linked=linked)
 
                 except Exception as e:
-                    print(f"make-article err ({article_title}) => {e}")
+                    print(f"move article err => {e}")
                     traceback.print_exc()
+                    return False
 
-            elif msg["type"] == "log":
+    else:
+        print("we dont' know how to parse this MW operation.", f"=> {msg}")
 
-                if msg["log_type"] == "delete":
+    return True
 
-                    if msg["log_action"] == "delete":
-                        try:
-                            await delete_article(article_title)
-                            await remove_article_traces(article_title)
 
-                            # update front-index if necessary
-                            art_cats = None
-                            await build_front_index(article_title, art_cats)
+async def worker(queue: asyncio.Queue, client, template) -> None:
+    """
+    Take one message at a time from the queue and process it.
+    Messages for the same article are processed one after the other.
 
-                        except Exception as e:
-                            print(f"delete article err => {e}")
-                            traceback.print_exc()
+    Once done, mark the journal messages the message has been merged
+    from as processed, or as failed (to replay them, see
+    `RCFeedProtocol.replay`).
+    """
 
-                elif msg["log_type"] == "move":
+    while True:
+        msg, article_title, ids = await queue.get()
 
-                    # we honor user's preference in the MW Move Article page:
-                    # if leave redirect behind is toggled, we leave the previous page
-                    # else we remove it, including any URL traces across the wiki
+        processed = False
 
-                    if msg["log_action"] in ["move", "delete_redir"]:
-                        try:
-                            redirect = msg["log_params"]
+        try:
+            processed = await handle_message(msg, article_title, client, template)
 
-                            # no-redirect:
-                            # - 0 => make redirect
-                            # - 1 => no redirect
-                            make_redirect = False
-                            if "noredir" in redirect and redirect["noredir"] == "0":
-                                make_redirect = True
+        except Exception as e:
+            print(f"server :: worker err => {e}")
+            traceback.print_exc()
 
-                            target = await make_article(redirect["target"], client)
-                            await update_categories(target)
+        finally:
+            if processed:
+                mark_processed(ids)
+            else:
+                mark_failed(ids)
 
-                            # update front-index if necessary
-                            art_title = target["title"]
-                            art_cats = target["metadata"]["categories"]
-                            await build_front_index(art_title, art_cats)
+            active_ids.difference_update(ids)
+            queue.task_done()
 
-                            if make_redirect:
-                                target_redirect = {
-                                    "title": target["title"],
-                                    "slug": target["slug"],
-                                }
 
-                                await make_redirect_article(
-                                    article_title, target_redirect
-                                )
+async def main(SERVER_IP: str | None, SERVER_PORT: int, ENV: str | None) -> None:
+    """
+    Server function that:
+    - listens to UDP message coming from the specified MediaWiki instance at SERVER_PORT
+    - appends every message to the journal, and replays the messages
+      of the journal not processed yet (eg before a restart)
+    - polls MediaWiki's recent changes to catch up with the messages
+      that got lost (see `reconcile.py`)
+    - renders the Event index page and the front index page again
+      whenever an event starts or ends (see `event_schedule.py`)
+    - coalesces bursts of messages for the same article (see `RCFeedProtocol`)
+    - puts each message in a queue, processed by a pool of SERVER_WORKERS workers
+    - fetches article by title using data from UDP message
+    - post-process article data and save it to disk as HTML
+    """
 
-                            else:
-                                await delete_article(article_title)
-                                await remove_article_traces(article_title)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=SERVER_QUEUE_SIZE)
 
-                            await save_article(target, target["slug"], template, sem)
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: RCFeedProtocol(queue), local_addr=(SERVER_IP, SERVER_PORT)
+    )
 
-                        except Exception as e:
-                            print(f"move article err => {e}")
-                            traceback.print_exc()
+    print(
+        "UDP server has started and is ready to receive...", f"{SERVER_IP, SERVER_PORT}"
+    )
 
-            else:
-                print("we dont' know how to parse this MW operation.", f"=> {msg}")
+    precompile_templates()
+    template = get_template("article")
+
+    # keep track of the HTML files written by other processes
+    # (eg a CLI build), used to rewrite article links
+    build_file_index()
+    stop_watch = asyncio.Event()
+    watch = asyncio.ensure_future(watch_file_index(stop_watch))
+    reconciler = None
+    schedule = None
+
+    try:
+        client = get_client()
+        workers = [
+            asyncio.ensure_future(worker(queue, client, template))
+            for _ in range(SERVER_WORKERS)
+        ]
+
+        prune_journal()
+        protocol.replay()
+
+        # catch up with the changes whose UDP message got lost
+        reconciler = asyncio.ensure_future(
+            watch_recent_changes(protocol, client, stop_watch)
+        )
+
+        # move events from upcoming to past as time goes by
+        schedule = asyncio.ensure_future(watch_event_boundaries(site_lock, stop_watch))
+
+        await asyncio.gather(*workers)
+
+    finally:
+        stop_watch.set()
+        await watch
+        if reconciler is not None:
+            await reconciler
+        if schedule is not None:
+            await schedule
+        await close_client()
+        transport.close()
 
 
 if __name__ == "__main__":
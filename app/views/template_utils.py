@@ -1,11 +1,63 @@
+from pathlib import Path
 from typing import Any
 from urllib.parse import quote_plus
 
 import arrow
 import jinja2
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    TemplateNotFound,
+)
 from slugify import slugify
 
+from app.db import DATA_DIR
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+environment = None
+
+
+def get_environment() -> jinja2.Environment:
+    """
+    Return the process-wide Jinja environment, creating it on first use.
+
+    Templates are compiled once per process and kept in the environment's
+    cache; the compiled bytecode is also saved to `<DATA_DIR>/templates`,
+    so the next process (a new build, a server restart) can skip
+    compiling templates that have not changed.
+    """
+
+    global environment
+
+    if environment is None:
+        cache_dir = Path(DATA_DIR) / "templates"
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+        environment = Environment(
+            loader=FileSystemLoader(TEMPLATES_DIR),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir),
+            autoescape=True,
+        )
+        environment.filters["slug"] = make_url_slug
+        environment.filters["ts"] = make_timestamp
+        environment.filters["tsh"] = make_timestamp_friendly
+
+    return environment
+
+
+def precompile_templates() -> None:
+    """
+    Load every template once, so that no build or request
+    pays for compiling them later on.
+    """
+
+    env = get_environment()
+
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+
 
 def get_template(template: str) -> jinja2.environment.Template:
     """
@@ -14,10 +66,7 @@ def get_template(template: str) -> jinja2.environment.Template:
 
     template = template.lower()
 
-    env = Environment(loader=FileSystemLoader("app/views/templates"), autoescape=True)
-    env.filters["slug"] = make_url_slug
-    env.filters["ts"] = make_timestamp
-    env.filters["tsh"] = make_timestamp_friendly
+    env = get_environment()
 
     try:
         t = env.get_template(f"{template}.html")
@@ -128,54 +177,138 @@ def ts_pad_hour(tokens: str) -> str | None:
         return ":".join(tokens)
 
 
-def paginator(
-    items: list[dict[Any, Any]], list_size: int, cursor: int | None
-) -> dict[str, list[int] | list[dict[Any, Any]] | dict[str, int | None] | int | None]:
+def get_event_times(
+    metadata: dict[str, str | dict[str, str]]
+) -> tuple[list[str] | None, list[str] | None]:
     """
-    Paginate over the given list of items by the specified list_size.
-    The function returns back a dictionary with a cursor value that
-    is used to navigate through the entire list.
+    Return the date and time tokens of the given Event article
+    metadata (eg [<start>, <end>]), if any.
     """
 
-    cursors = []
-    pagination = []
-    cur_prev = None
-    cur_next = None
+    date = None
+    time = None
 
-    if len(items) == 0:
-        return {
-            "pages": pagination,
-            "data": items,
-            "nav": {
-                "current": cursor,
-                "prev": cur_prev,
-                "next": cur_next,
-            },
-        }
+    if "date" in metadata["parsed_metadata"]:
+        date = extract_datetime(metadata["parsed_metadata"]["date"])
 
-    for i in range(len(items)):
-        pagenum, offset = divmod(i, list_size)
-        if offset == 0:
-            cursors.append(i)
+    if "time" in metadata:
+        time = extract_datetime(metadata["parsed_metadata"]["time"])
 
-    # cursor eg => [0, 50, 100, 150, 200]
-    # we use this value to set the left-hand side of the slice command
-    # eg where we want to start slicing from
+    return date, time
+
+
+def make_event_timestamps(
+    metadata: dict[str, str | dict[str, str]]
+) -> dict[str, float | str | dict[str, str | None] | None]:
+    """
+    Parse the date and time of the given Event article metadata once,
+    into:
+    - start, end: epoch timestamps, to sort events and tell
+      upcoming, happening and past ones apart
+    - time: the normalized time string (eg 09:00-12:00)
+    - dates, times, labels: the start and end as YYYY-MM-DD,
+      HH:mm and DD MMM YYYY strings, for the templates
+    """
+
+    date, time = get_event_times(metadata)
+
+    timestamps = {
+        "start": None,
+        "end": None,
+        "time": None,
+        "dates": {"start": None, "end": None},
+        "times": {"start": None, "end": None},
+        "labels": {"start": None, "end": None},
+    }
 
-    for idx, page in enumerate(cursors):
-        pagination.append(idx)
+    article_ts = {"start": None, "end": None}
 
-    data = items[cursors[cursor] : (cursors[cursor] + list_size)]
+    try:
+        if date is not None and time is not None:
+            ts_start = ts_pad_hour(time[0].split(":"))
+            ts_end = None
+            timestamps["time"] = ts_start
+
+            if len(time) > 1:
+                ts_end = ts_pad_hour(time[1].split(":"))
+                timestamps["time"] = f"{ts_start}-{ts_end}"
+
+            dts_start = f"{date[0]} {ts_start}"
+            article_ts["start"] = arrow.get(dts_start, "YYYY/MM/DD HH:mm")
+
+            if len(date) > 1:
+                dts_end = f"{date[1]} {ts_end or ts_start}"
+                article_ts["end"] = arrow.get(dts_end, "YYYY/MM/DD HH:mm")
+
+        elif date is not None:
+            article_ts["start"] = arrow.get(date[0], "YYYY/MM/DD")
+
+            if len(date) > 1:
+                article_ts["end"] = arrow.get(date[1], "YYYY/MM/DD")
+
+    except (ValueError, TypeError, IndexError) as e:
+        print(f"event-timestamps err => {metadata['displaytitle']}: {e}")
+        article_ts = {"start": None, "end": None}
+
+    for k, ts in article_ts.items():
+        if ts is not None:
+            timestamps[k] = ts.timestamp()
+            timestamps["dates"][k] = ts.format("YYYY-MM-DD")
+            timestamps["times"][k] = ts.format("HH:mm")
+            timestamps["labels"][k] = make_timestamp_friendly(timestamps["dates"][k])
+
+    return timestamps
+
+
+def make_timestamps(
+    article: dict[str, str | list[dict[str, str]]]
+) -> dict[str, float | str | None]:
+    """
+    Parse the creation and last modified timestamps of the given
+    article (as returned by MediaWiki) once, keeping both the
+    original ISO strings and their epoch timestamps, plus the
+    friendly creation date for the templates.
+    """
+
+    timestamps = {}
+
+    for k in ["creation", "last_modified"]:
+        timestamps[k] = article[k]
+        timestamps[f"{k}_epoch"] = None
+
+        if article[k]:
+            timestamps[f"{k}_epoch"] = arrow.get(article[k]).timestamp()
+
+    timestamps["creation_label"] = make_timestamp_friendly(
+        make_timestamp_full(article["creation"])
+    )
+
+    return timestamps
+
+
+def paginator_from_count(
+    data: list[dict[Any, Any]], total: int, list_size: int, cursor: int
+) -> dict[str, list[int] | list[dict[Any, Any]] | dict[str, int | None] | int | None]:
+    """
+    Paginate over total items by the specified list_size, given only
+    the cursor's page of items (eg fetched through LIMIT / OFFSET).
+    The function returns back a dictionary with a cursor value that
+    is used to navigate through the entire list.
+    """
+
+    pages = list(range(-(-total // list_size)))
+
+    cur_prev = None
+    cur_next = None
 
-    if cursor is not None:
-        if cursor > 0:
-            cur_prev = cursor - 1
+    if cursor > 0:
+        cur_prev = cursor - 1
 
-        if cursor < len(cursors) - 1:
-            cur_next = cursor + 1
+    if cursor < len(pages) - 1:
+        cur_next = cursor + 1
 
     return {
-        "pages": pagination,
+        "pages": pages,
         "data": data,
         "nav": {
             "current": cursor,
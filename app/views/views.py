@@ -1,22 +1,15 @@
-import asyncio
 import json
-import os
+import time
 from typing import Collection, Sequence
 
-import aiofiles
-import arrow
-import httpx
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from slugify import slugify
 
-from app.build_article import make_article, make_footer_nav, make_nav
-from app.fetch import create_context, fetch_category
-from app.file_ops import file_lookup
+from app.build_article import make_footer_nav, make_nav
 from app.log_to_file import main as log
 from app.read_settings import main as read_settings
 
-from .template_utils import extract_datetime, get_template, ts_pad_hour, make_mw_url_slug
+from .template_utils import get_template, make_event_timestamps, make_mw_url_slug
 
 load_dotenv()
 
@@ -25,157 +18,94 @@ load_dotenv()
 
 
 async def make_front_index(
-    home_art: str, home_cat: str
+    intro: dict[str, list[str] | list[dict[str, str]]],
+    highlights: list[dict[str, str | dict]],
+    events: list[dict[str, str | dict]],
 ) -> dict[str, bool | dict[str, int]]:
     """
-    Prepare necessary data for the Front index page.
+    Prepare necessary data for the Front index page, from its sections:
+    - intro: the frontpage article (eg `Hackers & Designers`)
+    - highlights: the records of the frontpage category articles
+    - events: the records of the Event articles, of which we
+      keep the upcoming ones
+
+    See `app/build_front_index.py` for how each section is kept.
     """
 
-    config = read_settings()
-    langs = config["wiki"]["langs"]
-
-    ENV = os.getenv("ENV")
-    context = create_context(ENV)
-    timeout = httpx.Timeout(10.0, connect=60.0)
-    async with httpx.AsyncClient(verify=context, timeout=timeout) as client:
-
-        # list of articles w/ `highlight` cat
-        data = await fetch_category(home_cat, client)
-        art_tasks = []
-        for article in data:
-            title = article["title"]
-            # filter away translations
-            lang_stem = title.split("/")[-1]
-            if lang_stem not in langs:
-                task = make_article(article["title"], client)
-                art_tasks.append(asyncio.ensure_future(task))
-
-        highlight_articles = await asyncio.gather(*art_tasks)
-        highlight_articles = [item for item in highlight_articles if item is not None]
-
-        # `Hackers & Designers` article
-        article = await make_article(home_art, client)
-        article["slug"] = "index"
-        article["last_modified"] = article["metadata"]["last_modified"]
-        article["backlinks"] = article["metadata"]["backlinks"]
-
-        # add highlights to dict
-        article["highlights"] = highlight_articles
-
-        # -- upcoming events
-        event_filename = slugify(config["wiki"]["categories"]["Event"]["label"])
-
-        upcoming_events = []
-        upcoming_events_str = []
-        events_path = file_lookup(event_filename)
-        current_timestamp = arrow.now().to("local")
-
-        if len(events_path) > 0:
-            async with aiofiles.open(events_path[0], mode="r") as f:
-                tree = await f.read()
-                soup = BeautifulSoup(tree, "lxml")
-
-                upcoming_events = soup.find_all("li", {"class": "when-upcoming"})
-
-                for event in upcoming_events:
-                    # check if upcoming-event's date is bigger than
-                    # current timestamp. this helps to keep the list of
-                    # upcoming events even when no change is done to an event
-                    # and by consequence to the events page, which we
-                    # use above to query for all the upcoming events.
-
-                    event_date = arrow.get(event.attrs["data-start"])
-
-                    if event_date > current_timestamp:
-                        upcoming_events_str.append(
-                            {
-                                "date": event_date,
-                                "html": str(event),
-                            }
-                        )
-
-                # sort event by ASC order using the `date` key
-                upcoming_events_str = sorted(
-                    upcoming_events_str, key=lambda e: e["date"]
-                )
-
-                # make new list keeping only the html of each event and get rid of the date key
-                article["upcoming"] = [event["html"] for event in upcoming_events_str]
-
-                return article
+    article = intro
+    article["slug"] = "index"
+    article["last_modified"] = article["metadata"]["last_modified"]
+    article["backlinks"] = article["metadata"]["backlinks"]
 
-        else:
-            print(f"make-frontindex err => {events_path} does not exist in the wiki.")
+    # add highlights to dict
+    article["highlights"] = highlights
+
+    # -- upcoming events, by ASC order
+    upcoming = [
+        event
+        for event in map(make_article_event, events)
+        if event["metadata"].get("when") == "upcoming"
+    ]
+
+    article["upcoming"] = sorted(upcoming, key=get_event_start)
+
+    return article
 
 
 # -- events
 
 
-def make_article_event(
+def get_event_timestamps(
     article: dict[str, list[str] | list[dict[str, str]]]
-) -> dict[str, list[str] | list[dict[str, str]]]:
+) -> dict[str, float | str | dict[str, str | None] | None]:
     """
-    Extend necessary data for the Event article.
+    Return the event timestamps of the given Event article, as parsed
+    when the article was built (see `make_event_timestamps`).
+    Records stored before they were kept are parsed here instead.
     """
 
-    date = None
-    time = None
-
-    date_now = arrow.now()
-
-    if "date" in article["metadata"]["parsed_metadata"]:
-        date = extract_datetime(article["metadata"]["parsed_metadata"]["date"])
-
-    if "time" in article["metadata"]:
-        time = extract_datetime(article["metadata"]["parsed_metadata"]["time"])
-
-    article_ts = {"start": None, "end": None}
+    timestamps = article["metadata"].get("timestamps", {})
 
-    if date is not None and time is not None:
+    if "event" in timestamps:
+        return timestamps["event"]
 
-        tokens_start = time[0].split(":")
-        ts_start = ts_pad_hour(tokens_start)
+    return make_event_timestamps(article["metadata"])
 
-        if len(time) > 1:
-            tokens_end = time[1].split(":")
-            ts_end = ts_pad_hour(tokens_end)
 
-            article["metadata"]["parsed_metadata"]["time"] = f"{ts_start}-{ts_end}"
-
-        else:
-            article["metadata"]["parsed_metadata"]["time"] = f"{ts_start}"
+def get_event_start(article: dict[str, list[str] | list[dict[str, str]]]) -> float:
+    """
+    Return the start timestamp of the given Event article,
+    to sort events by (those without a start come first).
+    """
 
-        # -- construct datetime start
-        date_start = date[0]
+    start = get_event_timestamps(article)["start"]
 
-        dts_start = f"{date_start} {ts_start}"
-        article_ts["start"] = arrow.get(dts_start, "YYYY/MM/DD HH:mm")
+    if start is None:
+        return float("-inf")
 
-        if len(date) > 1:
-            # -- construct datetime end
-            date_end = date[1]
+    return start
 
-            dts_end = f"{date_end} {ts_end}"
-            article_ts["end"] = arrow.get(dts_end, "YYYY/MM/DD HH:mm")
 
-    elif date is not None:
-        date_start = date[0]
+def make_article_event(
+    article: dict[str, list[str] | list[dict[str, str]]]
+) -> dict[str, list[str] | list[dict[str, str]]]:
+    """
+    Extend necessary data for the Event article.
+    """
 
-        dts_start = f"{date_start}"
-        article_ts["start"] = arrow.get(dts_start, "YYYY/MM/DD")
+    date_now = time.time()
 
-        if len(date) > 1:
-            date_end = date[1]
+    article_ts = get_event_timestamps(article)
 
-            dts_end = f"{date_end}"
-            article_ts["end"] = arrow.get(dts_end, "YYYY/MM/DD")
+    if article_ts["time"] is not None:
+        article["metadata"]["parsed_metadata"]["time"] = article_ts["time"]
 
     if article_ts["start"] is not None and article_ts["end"] is not None:
 
         if date_now > article_ts["start"] and date_now < article_ts["end"]:
             article["metadata"]["when"] = "happening"
 
-    if article_ts["start"]:
+    if article_ts["start"] is not None:
 
         if date_now < article_ts["start"]:
             article["metadata"]["when"] = "upcoming"
@@ -185,30 +115,9 @@ def make_article_event(
 
     # -- prepare article dates for template
 
-    article["metadata"]["dates"] = {"start": None, "end": None}
-    article["metadata"]["times"] = {"start": None, "end": None}
-
-    if article_ts["start"] is not None:
-        article["metadata"]["dates"]["start"] = arrow.get(article_ts["start"]).format(
-            "YYYY-MM-DD"
-        )
-        article["metadata"]["times"]["start"] = arrow.get(article_ts["start"]).format(
-            "HH:mm"
-        )
-    else:
-        article["metadata"]["dates"]["start"] = None
-        article["metadata"]["times"]["start"] = None
-
-    if article_ts["end"] is not None:
-        article["metadata"]["dates"]["end"] = arrow.get(article_ts["end"]).format(
-            "YYYY-MM-DD"
-        )
-        article["metadata"]["times"]["end"] = arrow.get(article_ts["end"]).format(
-            "HH:mm"
-        )
-    else:
-        article["metadata"]["dates"]["end"] = None
-        article["metadata"]["times"]["end"] = None
+    article["metadata"]["dates"] = article_ts["dates"]
+    article["metadata"]["times"] = article_ts["times"]
+    article["metadata"]["labels"] = article_ts["labels"]
 
     return article
 
@@ -265,15 +174,9 @@ async def make_event_index(
             # events.append(article)
 
     # -- sorting events by date desc
-    events['upcoming'] = sorted(
-        events['upcoming'], key=lambda d: d["metadata"]["dates"]["start"] or ""
-    )
-    events['happening'] = sorted(
-        events['happening'], key=lambda d: d["metadata"]["dates"]["start"] or ""
-    )
-    events['past'] = sorted(
-        events['past'], key=lambda d: d["metadata"]["dates"]["start"] or "", reverse=True
-    )
+    events['upcoming'] = sorted(events['upcoming'], key=get_event_start)
+    events['happening'] = sorted(events['happening'], key=get_event_start)
+    events['past'] = sorted(events['past'], key=get_event_start, reverse=True)
     await log("info", f"make-event => un-filtered {len(events)}\n", sem=None)
 
     await log("info", f"make-event => filtered {len(events)}\n", sem=None)
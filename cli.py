@@ -11,6 +11,7 @@ from app.copy_assets import main as copy_assets
 from app.build_category_index import make_category_index
 from app.build_front_index import build_front_index
 from app.build_wiki import main as bw
+from app.fetch import close_client
 from app.file_ops import write_to_disk
 from app.make_change_in_wiki import main as mc
 from app.server import main as srv
@@ -31,8 +32,9 @@ def setup():
     MEDIA_DIR = os.getenv("MEDIA_DIR")
     ASSETS_DIR = os.getenv("ASSETS_DIR")
     LOG_DIR = os.getenv("LOG_DIR")
+    DATA_DIR = os.getenv("DATA_DIR")
 
-    dir_list = [WIKI_DIR, MEDIA_DIR, ASSETS_DIR, LOG_DIR]
+    dir_list = [WIKI_DIR, MEDIA_DIR, ASSETS_DIR, LOG_DIR, DATA_DIR]
 
     async def make_dirs_setup(dir_list: [str]):
         for path_dir in dir_list:
@@ -64,7 +66,12 @@ def server():
 
 
 @app.command()
-def build_wiki():
+def build_wiki(
+    incremental: Annotated[
+        bool,
+        typer.Option(help="rebuild only articles changed since the last build"),
+    ] = False
+):
     """
     Rebuild entire wiki from scratch.
     """
@@ -74,7 +81,7 @@ def build_wiki():
 
     start_time = time.time()
     # -- run everything
-    asyncio.run(bw(ENV, URL))
+    asyncio.run(bw(ENV, URL, incremental))
     print("--- %s seconds ---" % (time.time() - start_time))
 
 
@@ -100,7 +107,11 @@ def build_frontpage():
     (re-) Build the frontpage article index page.
     """
 
-    asyncio.run(build_front_index(article_title=None, article_cats=None))
+    async def make_frontpage():
+        await build_front_index(article_title=None, article_cats=None)
+        await close_client()
+
+    asyncio.run(make_frontpage())
 
 
 @app.command()
@@ -115,10 +126,17 @@ def build_category_index(
 
     index = index.lower()
 
-    cat_index = asyncio.run(make_category_index(index))
+    # run in a single event loop, as the HTTP client
+    # can't be shared between event loops
+    async def make_index(index: str):
+        cat_index = await make_category_index(index)
+
+        if cat_index is not None:
+            filepath = f"{cat_index['slug']}"
+            await write_to_disk(filepath, cat_index["html"], sem=None)
+
+        await close_client()
 
-    if cat_index is not None:
-        filepath = f"{cat_index['slug']}"
-        asyncio.run(write_to_disk(filepath, cat_index["html"], sem=None))
+    asyncio.run(make_index(index))
 if __name__ == "__main__":
     app()
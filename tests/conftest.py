@@ -0,0 +1,70 @@
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+# app modules read settings.toml from the current folder and their
+# paths from the environment when imported: run them from a temporary
+# folder, with the example settings and relative output folders
+WORK_DIR = Path(tempfile.mkdtemp(prefix="hd-www-tests-"))
+shutil.copy(ROOT / "settings-example.toml", WORK_DIR / "settings.toml")
+os.chdir(WORK_DIR)
+
+# `app/main.py` checks WIKI_DIR and its assets folder exist when imported
+(WORK_DIR / "wiki" / "assets").mkdir(parents=True)
+(WORK_DIR / "logs").mkdir()
+
+os.environ.update(
+    {
+        "ENV": "dev",
+        "WIKI_DIR": "wiki",
+        "ASSETS_DIR": "assets",
+        "MEDIA_DIR": "wiki/assets/media",
+        "LOG_DIR": "logs",
+        "DATA_DIR": "data",
+        "BASE_URL": "http://localhost/api.php",
+        "SEMAPHORE": "10",
+    }
+)
+
+sys.path.insert(0, str(ROOT))
+
+from app import file_ops  # noqa: E402
+from app.db import get_db  # noqa: E402
+
+# tables of the build database (see `app/db.py`)
+TABLES = [
+    "manifest",
+    "links",
+    "category_items",
+    "categories",
+    "redirects",
+    "journal",
+    "front_sections",
+    "cursors",
+    "search",
+]
+
+
+@pytest.fixture(autouse=True)
+def clean_build():
+    """
+    Start every test with an empty WIKI_DIR and build database.
+    """
+
+    wiki_dir = WORK_DIR / "wiki"
+    shutil.rmtree(wiki_dir, ignore_errors=True)
+    (wiki_dir / "assets").mkdir(parents=True)
+    file_ops.file_index = None
+
+    db = get_db()
+    for table in TABLES:
+        db.execute(f"DELETE FROM {table}")
+    db.commit()
+
+    yield wiki_dir
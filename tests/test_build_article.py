@@ -0,0 +1,54 @@
+import asyncio
+
+from app.build_article import delete_article, remove_article_traces
+from app.link_graph import get_linked_pages, update_links
+
+
+def write_page(wiki_dir, slug: str, links: list[str]) -> None:
+    items = "".join(links)
+    html = f"<html><body><main><h1>{slug}</h1><ul>{items}</ul></main></body></html>"
+    (wiki_dir / f"{slug}.html").write_text(html)
+
+
+def make_wiki(wiki_dir) -> None:
+    """
+    Bar links to Jane, and is linked by Foo Event: Jane lists Bar
+    in its "What links here" block (`href="bar"`), Foo Event has a
+    body link to it (`href="/bar"`).
+    """
+
+    write_page(wiki_dir, "bar", ['<li><a href="/jane">Jane</a></li>'])
+    write_page(wiki_dir, "jane", ['<li><a href="bar">Bar</a></li>'])
+    write_page(wiki_dir, "foo-event", ['<li><a href="/bar.html#info">Bar</a></li>'])
+
+    update_links("bar", [{"title": "Jane", "slug": "jane"}])
+    update_links("foo-event", [{"title": "Bar", "slug": "bar"}])
+
+
+def test_delete_then_remove_traces(clean_build):
+    wiki_dir = clean_build
+    make_wiki(wiki_dir)
+
+    # as the UDP server does: look up the linked pages,
+    # delete the article, then remove its traces
+    linked = get_linked_pages("bar")
+    asyncio.run(delete_article("Bar"))
+    asyncio.run(remove_article_traces("Bar", linked=linked))
+
+    assert not (wiki_dir / "bar.html").exists()
+    assert 'href="bar"' not in (wiki_dir / "jane.html").read_text()
+    assert "/bar" not in (wiki_dir / "foo-event.html").read_text()
+
+
+def test_remove_traces_then_delete(clean_build):
+    wiki_dir = clean_build
+    make_wiki(wiki_dir)
+
+    # as the incremental build does
+    asyncio.run(remove_article_traces("Bar"))
+    asyncio.run(delete_article("Bar"))
+
+    assert not (wiki_dir / "bar.html").exists()
+    assert 'href="bar"' not in (wiki_dir / "jane.html").read_text()
+    assert "/bar" not in (wiki_dir / "foo-event.html").read_text()
+    assert "jane" not in get_linked_pages("bar")
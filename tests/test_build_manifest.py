@@ -0,0 +1,37 @@
+from app.build_manifest import diff_manifest
+
+
+def make_entry(title: str, slug: str, revid: int) -> dict:
+    return {"title": title, "slug": slug, "revid": revid}
+
+
+def test_diff_manifest_changed():
+    pages = {
+        "Foo Event": {"lastrevid": 20},
+        "Bar Tool": {"lastrevid": 41},
+        "New Page": {"lastrevid": 1},
+    }
+    manifest = {
+        "foo-event": make_entry("Foo Event", "foo-event", 20),
+        "bar-tool": make_entry("Bar Tool", "bar-tool", 40),
+    }
+
+    changed, unlisted = diff_manifest(pages, manifest)
+
+    assert changed == ["Bar Tool", "New Page"]
+    assert unlisted == []
+
+
+def test_diff_manifest_unlisted():
+    pages = {"Foo Event": {"lastrevid": 20}}
+    manifest = {
+        "foo-event": make_entry("Foo Event", "foo-event", 20),
+        "about": make_entry("About", "about", 70),
+        # the frontpage, saved under a slug not derived from its title
+        "index": make_entry("Hackers & Designers", "index", 10),
+    }
+
+    changed, unlisted = diff_manifest(pages, manifest)
+
+    assert changed == []
+    assert unlisted == ["About"]
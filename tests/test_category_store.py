@@ -0,0 +1,36 @@
+from app.category_store import (
+    get_category_items,
+    is_translation,
+    upsert_category_item,
+)
+
+
+def make_article(title: str, slug: str) -> dict:
+    return {
+        "title": title,
+        "slug": slug,
+        "metadata": {
+            "displaytitle": title,
+            "images": [],
+            "creation": "2024-01-01T00:00:00Z",
+            "timestamps": {},
+            "backlinks": [],
+            "parsed_metadata": {},
+            "tool_repos": [],
+        },
+    }
+
+
+def test_is_translation():
+    assert is_translation("Foo Event/nl")
+    assert not is_translation("Foo Event")
+    assert not is_translation("Foo/Bar")
+
+
+def test_upsert_category_item_skips_translations():
+    upsert_category_item("Event", make_article("Foo Event", "foo-event"))
+    upsert_category_item("Event", make_article("Foo Event/nl", "foo-event-nl"))
+
+    items = get_category_items("Event")
+
+    assert [item["title"] for item in items] == ["Foo Event"]
@@ -0,0 +1,45 @@
+from app import journal
+from app.journal import (
+    append_to_journal,
+    get_unprocessed,
+    mark_failed,
+    mark_processed,
+)
+
+EDIT = {"id": 1, "type": "edit", "title": "Foo Event", "namespace": 0}
+
+
+def test_append_to_journal_skips_known_rcid():
+    journal_id = append_to_journal(EDIT, "Foo Event")
+
+    assert journal_id is not None
+    assert append_to_journal(EDIT, "Foo Event") is None
+
+
+def test_get_unprocessed():
+    first = append_to_journal(EDIT, "Foo Event")
+    second = append_to_journal({**EDIT, "id": 2}, "Foo Event")
+    third = append_to_journal({**EDIT, "id": 3}, "Bar Tool")
+
+    mark_processed([second])
+
+    entries = get_unprocessed()
+
+    assert [entry["id"] for entry in entries] == [first, third]
+    assert entries[1] == {
+        "id": third,
+        "title": "Bar Tool",
+        "msg": {**EDIT, "id": 3},
+    }
+
+
+def test_get_unprocessed_gives_up_after_max_failures(monkeypatch):
+    monkeypatch.setattr(journal, "JOURNAL_MAX_FAILURES", 2)
+
+    journal_id = append_to_journal(EDIT, "Foo Event")
+
+    mark_failed([journal_id])
+    assert [entry["id"] for entry in get_unprocessed()] == [journal_id]
+
+    mark_failed([journal_id])
+    assert get_unprocessed() == []
@@ -0,0 +1,98 @@
+import asyncio
+import gzip
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import page_cache
+from app.main import app
+from app.page_cache import accepted_encodings, get_page, is_not_modified
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    page_cache.page_cache.clear()
+    page_cache.page_cache_bytes = 0
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def write_page(wiki_dir, slug: str, html: str) -> None:
+    (wiki_dir / f"{slug}.html").write_text(html)
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate, br") == ["br", "gzip"]
+    assert accepted_encodings("br;q=0, gzip;q=0.5") == ["gzip"]
+    assert accepted_encodings(None) == []
+
+
+def test_get_page_cached_until_changed(clean_build):
+    write_page(clean_build, "foo", "<p>foo</p>")
+
+    page = asyncio.run(get_page("foo"))
+    assert asyncio.run(get_page("foo")) is page
+
+    write_page(clean_build, "foo", "<p>foo, edited</p>")
+
+    edited = asyncio.run(get_page("foo"))
+    assert edited["body"] == b"<p>foo, edited</p>"
+    assert edited["etag"] != page["etag"]
+
+
+def test_get_page_precompressed(clean_build):
+    write_page(clean_build, "foo", "<p>foo</p>")
+    (clean_build / "foo.html.gz").write_bytes(gzip.compress(b"<p>foo</p>"))
+
+    page = asyncio.run(get_page("foo", ["br", "gzip"]))
+    assert page["encoding"] == "gzip"
+
+    # a compressed version older than the page is left out
+    os.utime(clean_build / "foo.html.gz", ns=(0, 0))
+    page = asyncio.run(get_page("foo", ["br", "gzip"]))
+    assert page["encoding"] is None
+
+
+def test_is_not_modified():
+    page = {"etag": '"abc"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+
+    assert is_not_modified({"if-none-match": '"abc"'}, page)
+    assert is_not_modified({"if-none-match": 'W/"abc", "def"'}, page)
+    assert not is_not_modified({"if-none-match": '"def"'}, page)
+
+    since = {"if-modified-since": "Tue, 02 Jan 2024 00:00:00 GMT"}
+    assert is_not_modified(since, page)
+    before = {"if-modified-since": "Sun, 31 Dec 2023 00:00:00 GMT"}
+    assert not is_not_modified(before, page)
+
+    # If-None-Match takes precedence over If-Modified-Since
+    assert not is_not_modified({"if-none-match": '"def"', **since}, page)
+
+
+def test_page_response_not_modified(clean_build, client):
+    write_page(clean_build, "foo", "<p>foo</p>")
+
+    response = client.get("/foo")
+    assert response.status_code == 200
+    assert response.text == "<p>foo</p>"
+
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    response = client.get("/foo", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get("/foo", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    write_page(clean_build, "foo", "<p>foo, edited</p>")
+
+    response = client.get("/foo", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.text == "<p>foo, edited</p>"
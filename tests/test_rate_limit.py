@@ -0,0 +1,118 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import fetch
+from app.rate_limit import RetryBudget, TokenBucket, get_retry_after
+
+URL = "http://localhost/api.php"
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    """
+    Give every test its own rate limiter and retry budget,
+    without waiting between retries.
+    """
+
+    monkeypatch.setattr(fetch, "bucket", TokenBucket(100))
+    monkeypatch.setattr(fetch, "retry_budget", RetryBudget(10))
+    monkeypatch.setattr(fetch, "get_backoff", lambda attempt: 0)
+    monkeypatch.setattr(fetch, "API_MAX_RETRIES", 2)
+
+
+def api_get(responses: list[httpx.Response]) -> tuple[dict, list[httpx.Request]]:
+    """
+    Run `api_get` against a transport answering with the given
+    responses in turn, and return its data and the requests sent.
+    """
+
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return responses[min(len(requests), len(responses)) - 1]
+
+    async def run():
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fetch.api_get(client, URL, {"action": "query"})
+
+    return asyncio.run(run()), requests
+
+
+def test_api_get():
+    data, requests = api_get([httpx.Response(200, json={"query": {}})])
+
+    assert data == {"query": {}}
+    assert len(requests) == 1
+    assert requests[0].url.params["maxlag"] == fetch.API_MAXLAG
+
+
+def test_api_get_retries_server_errors():
+    data, requests = api_get(
+        [
+            httpx.Response(503),
+            httpx.Response(200, json={"error": {"code": "maxlag"}}),
+            httpx.Response(200, json={"query": {}}),
+        ]
+    )
+
+    assert data == {"query": {}}
+    assert len(requests) == 3
+
+
+def test_api_get_slows_down_when_rate_limited():
+    data, requests = api_get(
+        [
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(200, json={"query": {}}),
+        ]
+    )
+
+    assert len(requests) == 2
+    assert fetch.bucket.rate < fetch.bucket.max_rate
+
+
+def test_api_get_gives_up():
+    with pytest.raises(httpx.HTTPStatusError):
+        api_get([httpx.Response(503)])
+
+
+def test_api_get_does_not_retry_client_errors():
+    with pytest.raises(httpx.HTTPStatusError):
+        api_get([httpx.Response(404)])
+
+
+def test_retry_budget():
+    budget = RetryBudget(1)
+
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    # each successful request gives back a tenth of a retry
+    for _ in range(11):
+        budget.deposit()
+
+    assert budget.withdraw()
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(8)
+
+    bucket.slow_down()
+    bucket.slow_down()
+    assert bucket.rate == 2
+
+    for _ in range(100):
+        bucket.speed_up()
+
+    assert bucket.rate == 8
+
+
+def test_get_retry_after():
+    assert get_retry_after("3") == 3
+    assert get_retry_after("Mon, 01 Jan 2024 00:00:00 GMT") == 0
+    assert get_retry_after("soon") is None
+    assert get_retry_after(None) is None
@@ -0,0 +1,68 @@
+import asyncio
+import sqlite3
+from pathlib import Path
+
+from app import redirect_map
+from app.db import DATA_DIR
+from app.redirect_map import (
+    add_legacy_redirect,
+    add_moved_redirect,
+    get_redirect,
+    load_redirect_map,
+    remove_redirects,
+    watch_redirect_map,
+)
+
+
+def test_get_redirect():
+    add_legacy_redirect("Coding in Situ", "coding-in-situ")
+    add_moved_redirect("old-event", "foo-event")
+    load_redirect_map()
+
+    assert get_redirect("s/Summer_Camp_2023/p/Coding_in_Situ") == (
+        "coding-in-situ",
+        301,
+    )
+    assert get_redirect("old-event.html") == ("foo-event", 301)
+    assert get_redirect("foo-event") is None
+
+    # legacy URIs of articles not in the map
+    assert get_redirect("p/About_Us") == ("about-us", 301)
+    assert get_redirect("s/Summer_Camp_2023") == ("events?type=hdsc2023", 308)
+
+
+def test_remove_redirects():
+    add_legacy_redirect("Old Event", "old-event")
+    add_moved_redirect("old-event", "foo-event")
+    remove_redirects("Old Event", "old-event")
+    load_redirect_map()
+
+    assert redirect_map.legacy_redirects == {}
+    assert redirect_map.moved_redirects == {}
+
+
+def test_watch_redirect_map(monkeypatch):
+    monkeypatch.setattr(redirect_map, "REDIRECTS_RELOAD", 0.01)
+    load_redirect_map()
+
+    async def run():
+        stop_event = asyncio.Event()
+        watch = asyncio.ensure_future(watch_redirect_map(stop_event))
+        await asyncio.sleep(0.05)
+
+        # another process (eg the UDP server) moves an article
+        other = sqlite3.connect(Path(DATA_DIR) / "build.db")
+        other.execute(
+            "INSERT INTO redirects (kind, source, target, status)"
+            " VALUES ('moved', 'old-event', 'foo-event', 301)"
+        )
+        other.commit()
+        other.close()
+
+        await asyncio.sleep(0.05)
+        stop_event.set()
+        await watch
+
+    asyncio.run(run())
+
+    assert get_redirect("old-event") == ("foo-event", 301)
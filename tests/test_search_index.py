@@ -0,0 +1,78 @@
+from app.search_index import (
+    make_match_query,
+    remove_from_search_index,
+    search_articles,
+    update_search_index,
+)
+
+
+def make_article(title: str, slug: str, text: str) -> dict:
+    return {
+        "title": title,
+        "slug": slug,
+        "metadata": {
+            "text": text,
+            "categories": ["article"],
+            "parsed_metadata": {},
+            "timestamps": {"last_modified": "2024-01-01T00:00:00Z"},
+        },
+    }
+
+
+def test_make_match_query():
+    assert make_match_query("open  call") == '"open" "call"'
+    assert make_match_query('say "hi" -x') == '"say" """hi""" "-x"'
+    assert make_match_query("  ") == ""
+
+
+def test_search_articles_ranks_title_first():
+    update_search_index(
+        make_article("Jane", "jane", "Jane runs a workshop about soldering.")
+    )
+    update_search_index(make_article("Soldering", "soldering", "Hot irons."))
+
+    total, results = search_articles("soldering", 10, 0)
+
+    assert total == 2
+    assert [result["slug"] for result in results] == ["soldering", "jane"]
+
+
+def test_search_articles_pagination():
+    for num in range(3):
+        update_search_index(make_article(f"Event {num}", f"event-{num}", "Meetup"))
+
+    total, results = search_articles("meetup", 2, 2)
+
+    assert total == 3
+    assert len(results) == 1
+
+
+def test_search_articles_escapes_snippet():
+    update_search_index(
+        make_article("Foo", "foo", "<script>alert(1)</script> hackers & designers")
+    )
+
+    total, results = search_articles("hackers", 10, 0)
+
+    assert total == 1
+    assert results[0]["snippet"] == (
+        "&lt;script&gt;alert(1)&lt;/script&gt; "
+        '<span class="searchmatch">hackers</span> &amp; designers'
+    )
+
+
+def test_search_articles_query_syntax():
+    update_search_index(make_article("Foo", "foo", "NOT a title: foo-bar"))
+
+    # FTS5 operators, column filters and quotes are matched as text
+    assert search_articles('title: "foo', 10, 0)[0] == 1
+    assert search_articles("NOT", 10, 0)[0] == 1
+    assert search_articles("foo-bar", 10, 0)[0] == 1
+    assert search_articles("bar*", 10, 0)[0] == 1
+
+
+def test_remove_from_search_index():
+    update_search_index(make_article("Foo", "foo", "Meetup"))
+    remove_from_search_index("foo")
+
+    assert search_articles("meetup", 10, 0) == (0, [])
@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import server
+from app.journal import append_to_journal, mark_processed
+
+EDIT = {"type": "edit", "title": "Foo Event", "namespace": 0}
+NEW = {"type": "new", "title": "Foo Event", "namespace": 0}
+DELETE = {
+    "type": "log",
+    "log_type": "delete",
+    "log_action": "delete",
+    "title": "Foo Event",
+    "namespace": 0,
+}
+RESTORE = {**DELETE, "log_action": "restore"}
+
+
+@pytest.fixture(autouse=True)
+def no_debounce(monkeypatch):
+    monkeypatch.setattr(server, "SERVER_DEBOUNCE", 0)
+    server.active_ids.clear()
+
+
+def coalesce(messages: list[dict]) -> tuple[dict, str, list[int]]:
+    """
+    Coalesce the given messages, in order, and return
+    the one message put in the queue.
+    """
+
+    async def run():
+        queue = asyncio.Queue()
+        protocol = server.RCFeedProtocol(queue)
+
+        for rcid, msg in enumerate(messages, start=1):
+            protocol.coalesce(msg, msg["title"], [rcid])
+
+        entry = await asyncio.wait_for(queue.get(), 1)
+        assert queue.empty()
+
+        return entry
+
+    return asyncio.run(run())
+
+
+def test_coalesce_keeps_strongest_operation():
+    msg, title, ids = coalesce([EDIT, EDIT, DELETE])
+
+    assert msg is DELETE
+    assert title == "Foo Event"
+    assert ids == [1, 2, 3]
+
+
+@pytest.mark.parametrize("recreate", [NEW, EDIT, RESTORE])
+def test_coalesce_edit_after_delete(recreate):
+    msg, title, ids = coalesce([EDIT, DELETE, recreate])
+
+    assert msg is recreate
+    assert server.get_operation(msg) == "edit"
+    assert ids == [1, 2, 3]
+
+
+def test_handle_message_fetch_error(monkeypatch):
+    """
+    A failed fetch is not taken for a deleted article: the message
+    is reported as not processed, so it is marked as failed.
+    """
+
+    async def make_article(*args, **kwargs):
+        raise httpx.ConnectError("connection refused")
+
+    monkeypatch.setattr(server, "make_article", make_article)
+
+    processed = asyncio.run(server.handle_message(EDIT, "Foo Event", None, None))
+
+    assert processed is False
+
+
+def test_replay_skips_processed_and_active_messages():
+    first = append_to_journal({**EDIT, "id": 1}, "Foo Event")
+    second = append_to_journal({**EDIT, "id": 2}, "Foo Event")
+    done = append_to_journal({**EDIT, "id": 3, "title": "Jane"}, "Jane")
+    active = append_to_journal({**EDIT, "id": 4, "title": "Bar Tool"}, "Bar Tool")
+
+    mark_processed([done])
+
+    async def run():
+        queue = asyncio.Queue()
+        protocol = server.RCFeedProtocol(queue)
+
+        # already on its way, eg waiting in the queue
+        server.active_ids.add(active)
+
+        protocol.replay()
+        entry = await asyncio.wait_for(queue.get(), 1)
+
+        # replaying again while the message is processed adds nothing
+        protocol.replay()
+        await asyncio.sleep(0.01)
+        assert queue.empty()
+
+        return entry
+
+    msg, title, ids = asyncio.run(run())
+
+    assert title == "Foo Event"
+    assert ids == [first, second]